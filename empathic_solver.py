@@ -166,6 +166,8 @@ def get_api_key():
 def set_api_key(api_key):
     """Save the Claude API key to keyring."""
     keyring.set_password(SERVICE_NAME, "claude_api_key", api_key)
+    if WHATSAPP_AVAILABLE:
+        whatsapp_integration.invalidate_api_key_cache()
     
     # Update config
     config = load_config()
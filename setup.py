@@ -13,10 +13,18 @@ setup(
         "requests>=2.28.0",
         "keyring>=23.0.0",
         "schedule>=1.2.0",
-        "selenium>=4.0.0",
-        "webdriver-manager>=3.8.0",
         "pillow>=9.0.0",
     ],
+    extras_require={
+        "whatsapp": [
+            "selenium>=4.0.0",
+            "webdriver-manager>=3.8.0",
+        ],
+        "speedups": [
+            "orjson>=3.6.0",
+            "pyahocorasick>=2.0.0",
+        ],
+    },
     entry_points="""
         [console_scripts]
         empathic-solver=empathic_solver:app
@@ -0,0 +1,243 @@
+"""
+Tests for the WhatsApp integration's task storage, response parsing and
+export handling. Each test runs against a fresh database in a temp directory.
+"""
+
+import pytest
+
+import whatsapp_integration as wi
+
+
+@pytest.fixture(autouse=True)
+def temp_db(tmp_path, monkeypatch):
+    """Point the module at an empty database for each test."""
+    wi.close_db()
+    monkeypatch.setattr(wi, "APP_DIR", tmp_path)
+    monkeypatch.setattr(wi, "DB_PATH", tmp_path / "problems.db")
+    monkeypatch.setattr(wi, "_processed_ids", None)
+    yield tmp_path / "problems.db"
+    wi.close_db()
+
+
+def make_task(message_id, description="Send the report to the team"):
+    return {
+        'message_id': message_id,
+        'sender': "Alice",
+        'original_message': "Please send the report to the team",
+        'task_description': description,
+        'timestamp': "2024-01-02T10:00:00",
+        'group_name': "Work",
+    }
+
+
+def fetch_task(task_id):
+    with wi._db() as conn:
+        return conn.execute(
+            "SELECT status, priority FROM whatsapp_tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+
+
+def count_tasks():
+    with wi._db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM whatsapp_tasks").fetchone()[0]
+
+
+# Task storage
+
+def test_save_tasks_inserts_new_tasks():
+    assert wi.save_tasks_to_db([make_task("m1"), make_task("m2")]) == 2
+    assert count_tasks() == 2
+
+
+def test_rescan_inserts_nothing():
+    tasks = [make_task("m1"), make_task("m2")]
+    wi.save_tasks_to_db(tasks)
+
+    assert wi.save_tasks_to_db(tasks) == 0
+    assert count_tasks() == 2
+
+
+def test_rescan_with_loaded_processed_ids_inserts_nothing():
+    tasks = [make_task("m1"), make_task("m2")]
+    wi.save_tasks_to_db(tasks)
+    wi.load_processed_message_ids()
+
+    assert wi.save_tasks_to_db(tasks + [make_task("m3")]) == 1
+    assert count_tasks() == 3
+
+
+def test_duplicates_within_one_batch_are_inserted_once():
+    assert wi.save_tasks_to_db([make_task("m1"), make_task("m1")]) == 1
+
+
+def test_already_processed_finds_marked_messages():
+    wi.mark_message_processed("Work|Alice||abc", "Work", "Alice")
+
+    assert wi.already_processed(["Work|Alice||abc", "Work|Bob||def"]) == {"Work|Alice||abc"}
+
+
+# Task commands
+
+@pytest.fixture(params=[True, False], ids=["returning", "no-returning"])
+def returning(request, monkeypatch):
+    """Run a test with and without UPDATE ... RETURNING support."""
+    monkeypatch.setattr(wi, "SQLITE_HAS_RETURNING", request.param)
+    return request.param
+
+
+@pytest.fixture
+def task_id():
+    wi.save_tasks_to_db([make_task("m1")])
+    with wi._db() as conn:
+        return conn.execute("SELECT id FROM whatsapp_tasks").fetchone()[0]
+
+
+@pytest.mark.parametrize("command, status", [
+    (wi.command_complete_whatsapp_task, "completed"),
+    (wi.command_pending_whatsapp_task, "pending"),
+])
+def test_status_commands(returning, task_id, command, status, capsys):
+    command(task_id)
+
+    assert fetch_task(task_id)[0] == status
+    assert "not found" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("command", [
+    wi.command_complete_whatsapp_task,
+    wi.command_pending_whatsapp_task,
+])
+def test_status_commands_missing_task(returning, command, capsys):
+    command(999)
+
+    assert "Task with ID 999 not found" in capsys.readouterr().out
+
+
+def test_priority_command(returning, task_id, capsys):
+    wi.command_update_whatsapp_task_priority(task_id, "HIGH")
+
+    assert fetch_task(task_id)[1] == "high"
+    assert "not found" not in capsys.readouterr().out
+
+
+def test_priority_command_missing_task(returning, capsys):
+    wi.command_update_whatsapp_task_priority(999, "low")
+
+    assert "Task with ID 999 not found" in capsys.readouterr().out
+
+
+def test_delete_command(returning, task_id, monkeypatch, capsys):
+    monkeypatch.setattr(wi.typer, "confirm", lambda message: True)
+
+    wi.command_delete_whatsapp_task(task_id)
+
+    assert fetch_task(task_id) is None
+    assert f"Task {task_id} deleted" in capsys.readouterr().out
+
+
+def test_delete_command_missing_task(returning, monkeypatch, capsys):
+    monkeypatch.setattr(wi.typer, "confirm", lambda message: pytest.fail("should not prompt"))
+
+    wi.command_delete_whatsapp_task(999)
+
+    assert "Task with ID 999 not found" in capsys.readouterr().out
+
+
+def test_write_task_returns_none_when_nothing_matches(returning, task_id):
+    with wi._db() as conn:
+        row = wi._write_task(
+            conn.cursor(),
+            "UPDATE whatsapp_tasks SET status = 'done' WHERE id = ? AND problem_id IS NOT NULL",
+            (task_id,),
+            task_id
+        )
+
+    assert row is None
+    assert fetch_task(task_id)[0] == "pending"
+
+
+# Batch response parsing
+
+def test_parse_tool_use_results():
+    response = '{"results": [{"index": 1, "tasks": ["Book the room"]}, {"index": 2, "tasks": []}]}'
+
+    assert wi._parse_batch_response(response, 3) == [["Book the room"], [], None]
+
+
+def test_parse_json_array_with_surrounding_prose():
+    response = 'Here you go:\n[{"index": 2, "tasks": ["Call Bob", " "]}]\nHope that helps [1].'
+
+    assert wi._parse_batch_response(response, 2) == [None, ["Call Bob"]]
+
+
+def test_parse_text_fallback():
+    response = "[1] Book the room\nOrder lunch\n[2] NO_TASK\n[3] Call Bob"
+
+    assert wi._parse_batch_response(response, 3) == [["Book the room", "Order lunch"], [], ["Call Bob"]]
+
+
+def test_parse_skips_malformed_index_entries():
+    response = (
+        '{"results": [{"index": 0, "tasks": ["zero"]}, {"index": 5, "tasks": ["too big"]}, '
+        '{"index": "1", "tasks": ["string index"]}, "junk", {"tasks": ["no index"]}, '
+        '{"index": 2, "tasks": ["Call Bob"]}]}'
+    )
+
+    assert wi._parse_batch_response(response, 2) == [None, ["Call Bob"]]
+
+
+def test_parse_text_fallback_ignores_out_of_range_markers():
+    response = "[9] Not a message\n[1] Book the room"
+
+    assert wi._parse_batch_response(response, 1) == [["Book the room"]]
+
+
+# Export parsing
+
+@pytest.mark.parametrize("stamp, expected", [
+    ("02/01/2024, 14:30", "2024-01-02T14:30:00"),
+    ("02/01/24, 14:30:15", "2024-01-02T14:30:15"),
+    ("02/01/24, 2:30 pm", "2024-01-02T14:30:00"),
+    ("02/01/2024, 2:30:15 PM", "2024-01-02T14:30:15"),
+    ("32/01/2024, 14:30", None),
+])
+def test_parse_export_timestamp(stamp, expected):
+    assert wi.parse_export_timestamp(stamp) == expected
+
+
+def test_iter_export_messages(tmp_path):
+    export = tmp_path / "WhatsApp Chat with Work.txt"
+    export.write_text(
+        "02/01/2024, 14:29 - Messages are end-to-end encrypted.\n"
+        "02/01/2024, 14:30 - Alice: Please send the report\n"
+        "and copy the team\n"
+        "\n"
+        "thanks\n"
+        "[02/01/24, 14:31:05] Bob: On it\n",
+        encoding="utf-8"
+    )
+
+    assert list(wi.iter_export_messages(export)) == [
+        ("02/01/2024, 14:30", "Alice", "Please send the report\nand copy the team\n\nthanks"),
+        ("02/01/24, 14:31:05", "Bob", "On it"),
+    ]
+
+
+# Message prefiltering
+
+def test_prefilter_drops_duplicates_and_media():
+    messages = ["Send the report today", "<Media omitted>", "Send the report today", "Call Bob tomorrow"]
+
+    assert list(wi.prefilter_messages(messages)) == ["Send the report today", "Call Bob tomorrow"]
+
+
+def test_prefilter_min_words():
+    messages = ["ok", "sounds good", "please book the room", ""]
+
+    assert list(wi.prefilter_messages(messages, min_words=3)) == ["please book the room"]
+
+
+def test_prefilter_text_of():
+    messages = [("t1", "Alice", "Send the report"), ("t2", "Bob", "Send the report")]
+
+    assert list(wi.prefilter_messages(messages, text_of=lambda message: message[2])) == [messages[0]]
@@ -15,13 +15,23 @@ import json
 import sqlite3
 import datetime
 from pathlib import Path
+from operator import itemgetter
+from collections import deque
+from itertools import islice
 import typer
 from typing import List, Dict, Optional, Union, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import keyring
 import time
 import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import atexit
 import base64
+import hashlib
+import importlib.util
 import io
 import sys
 import random
@@ -35,44 +45,85 @@ DB_PATH = APP_DIR / "problems.db"
 WHATSAPP_CONFIG_PATH = APP_DIR / "whatsapp_config.json"
 WHATSAPP_SESSION_PATH = APP_DIR / "whatsapp_session"
 SERVICE_NAME = "empathic-solver"
+CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+CLAUDE_BATCHES_URL = "https://api.anthropic.com/v1/messages/batches"
+MESSAGE_BATCH_MAX_WAIT = 3600  # seconds to wait for a Message Batch to finish
+CLAUDE_API_TIMEOUT = (5, 60)  # (connect, read) seconds
+MAX_MESSAGES_PER_CLAUDE_CALL = 20
+MAX_PROMPT_TOKENS_PER_CLAUDE_CALL = 2000  # estimated input tokens of messages per call
+CLAUDE_RPM_LIMIT = 50  # default requests per minute (tier 1); "claude_rpm_limit" in the config
+CLAUDE_OUTPUT_TPM_LIMIT = 10000  # default output tokens per minute (tier 1); "claude_output_tpm_limit"
+CLAUDE_CACHE_TTL_DAYS = 30
+EXPORT_CHUNK_SIZE = 500  # Export messages analyzed and saved per chunk
+PAGE_LOAD_TIMEOUT = 30
+SCRIPT_TIMEOUT = 15
+WAIT_POLL_FREQUENCY = 0.1  # seconds between explicit-wait checks (Selenium defaults to 0.5)
+MAX_SCAN_WORKERS = 4
+WHATSAPP_SESSION_MAX_AGE_DAYS = 14  # How long a linked WhatsApp Web session stays valid
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)  # UPDATE/DELETE ... RETURNING
 
-# Define SELENIUM_AVAILABLE globally before using it
-SELENIUM_AVAILABLE = False
+# Selenium is slow to import and only needed once a browser is launched, so
+# startup just checks that it is installed; _ensure_selenium() imports it
+SELENIUM_AVAILABLE = (
+    importlib.util.find_spec("selenium") is not None
+    and importlib.util.find_spec("webdriver_manager") is not None
+)
+_selenium_loaded = False
 
-try:
-    # Try to import browser automation libraries
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.common.keys import Keys
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.common.exceptions import (
-        TimeoutException, 
-        NoSuchElementException, 
-        StaleElementReferenceException,
-        ElementNotInteractableException,
-        ElementClickInterceptedException,
-        WebDriverException
-    )
+def _ensure_selenium():
+    """Import the browser automation libraries into module globals on first use."""
+    global _selenium_loaded, SELENIUM_AVAILABLE
+    global webdriver, Service, Options, By, Keys, WebDriverWait, EC
+    global TimeoutException, NoSuchElementException, StaleElementReferenceException
+    global ElementNotInteractableException, ElementClickInterceptedException, WebDriverException
+    global ChromeDriverManager, GeckoDriverManager, EdgeChromiumDriverManager
+    
+    if _selenium_loaded:
+        return SELENIUM_AVAILABLE
     
-    # Try different webdriver managers based on browser type
     try:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import (
+            TimeoutException, 
+            NoSuchElementException, 
+            StaleElementReferenceException,
+            ElementNotInteractableException,
+            ElementClickInterceptedException,
+            WebDriverException
+        )
         from webdriver_manager.chrome import ChromeDriverManager
-        from webdriver_manager.firefox import GeckoDriverManager
-        from webdriver_manager.microsoft import EdgeChromiumDriverManager
-        SELENIUM_AVAILABLE = True
-    except ImportError:
-        # Fall back to just ChromeDriverManager
+        
+        # Firefox and Edge managers are missing from some webdriver-manager versions
         try:
-            from webdriver_manager.chrome import ChromeDriverManager
-            SELENIUM_AVAILABLE = True
+            from webdriver_manager.firefox import GeckoDriverManager
+            from webdriver_manager.microsoft import EdgeChromiumDriverManager
         except ImportError:
-            SELENIUM_AVAILABLE = False
+            pass
+    except ImportError:
+        SELENIUM_AVAILABLE = False
+    
+    _selenium_loaded = True
+    return SELENIUM_AVAILABLE
+
+# orjson parses and serializes several times faster than the stdlib json module
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    # SELENIUM_AVAILABLE remains False
-    pass
+    ORJSON_AVAILABLE = False
+
+# Aho-Corasick gives a single linear pass over a message for all task keywords
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 # Updated WhatsApp Web selectors for 2025 (more comprehensive)
 WHATSAPP_SELECTORS = {
@@ -157,48 +208,584 @@ WHATSAPP_SELECTORS = {
     ]
 }
 
+# Words that suggest a message may contain a task. Messages without any of
+# these are not worth a Claude round-trip.
+TASK_KEYWORDS = [
+    "please", "pls", "plz", "can you", "could you", "would you",
+    "todo", "to do", "to-do", "task", "action item",
+    "need to", "needs to", "have to", "has to", "must", "should",
+    "remind", "remember", "don't forget", "dont forget",
+    "deadline", "due", "asap", "urgent", "eod", "by tomorrow", "by today",
+    "check", "review", "create", "update", "send", "prepare",
+    "schedule", "call", "verify", "complete", "finish", "submit", "follow up"
+]
+
+# Precompiled patterns used on every message
+_NUMBERED_ITEM_RE = re.compile(r"^\d+\.\s+")  # "1. Do something"
+_TASK_PREFIXES = ("- ", "* ", "• ", "todo:", "to do:", "task:")
+_TASK_PREFIX_RE = re.compile(r"^(?:(?:[-*•] |todo:|to do:|task:)\s*)+", re.IGNORECASE)
+_REQUEST_PHRASE_RE = re.compile(r"please|can you", re.IGNORECASE)
+_ACTION_VERBS = frozenset(["check", "review", "create", "update", "send", "prepare", "schedule", "call", "verify", "complete"])
+_BATCH_MARKER_RE = re.compile(r"^\[(\d+)\]\s*(.*)$")  # "[3] ..." in batched responses
+_WORD_RE = re.compile(r"\S+")
+_JSON_DECODER = json.JSONDecoder()
+_CACHE_WORD_RE = re.compile(r"\w+")
+_MEDIA_RE = re.compile(r"<Media omitted>|(?:image|video|audio|sticker|GIF|document) omitted", re.IGNORECASE)
+# Export line prefix: "[dd/mm/yy, hh:mm:ss] " (iOS) or "dd/mm/yyyy, hh:mm - " (Android),
+# with optional seconds and AM/PM
+_EXPORT_TIMESTAMP_RE = re.compile(
+    r'^\[?(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?::\d{2})?(?:\s?[APap][Mm])?)\]?(?:\s-)?\s'
+)
+
+def _build_keyword_matcher(keywords):
+    """Build a function that reports whether lowercase text contains any keyword."""
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
+    
+    # Fall back to one compiled alternation of the literal keywords
+    pattern = re.compile("|".join(re.escape(keyword) for keyword in keywords))
+    return lambda text: pattern.search(text) is not None
+
+_task_keyword_matcher = _build_keyword_matcher(TASK_KEYWORDS)
+
+def has_task_keyword(message_text):
+    """Check whether a message contains any task keyword."""
+    return _task_keyword_matcher(message_text.lower())
+
+def _json_loads(data):
+    """Parse JSON text or bytes, using orjson when available."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj):
+    """Serialize an object to indented JSON text, using orjson when available."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+def _json_payload(obj):
+    """Serialize an object to compact UTF-8 JSON bytes for a request body."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+# The keyring lookup can take tens of milliseconds (DBus, Keychain), so the
+# key is remembered for the life of the process once found
+_api_key = None
+
 def get_api_key():
     """Get the Claude API key from keyring."""
-    api_key = keyring.get_password(SERVICE_NAME, "claude_api_key")
-    return api_key
+    global _api_key
+    if _api_key is None:
+        _api_key = keyring.get_password(SERVICE_NAME, "claude_api_key")
+    return _api_key
+
+def invalidate_api_key_cache():
+    """Forget the remembered API key so the next call reads the keyring again."""
+    global _api_key
+    _api_key = None
+
+# Shared HTTP session so repeated Claude calls reuse pooled TLS connections
+_session = None
+_session_lock = threading.Lock()
+
+class _ClaudeRetry(Retry):
+    """Retry policy for the Claude session.
+    
+    GETs (batch polling) retry on the usual transient statuses. A POST may
+    already have created a message or batch, so it is only retried on 429/529,
+    which the API returns without processing the request. Connect errors are
+    retried for both, and read errors only for GETs.
+    """
+    POST_RETRY_STATUSES = frozenset([429, 529])
+    
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST":
+            return status_code in self.POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+def _get_session():
+    """Return the shared Claude API session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retries = _ClaudeRetry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504, 529),
+                    raise_on_status=False
+                )
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+                session.headers.update({
+                    "anthropic-version": "2023-06-01",
+                    "content-type": "application/json"
+                })
+                _session = session
+    return _session
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace requests under a rate limit."""
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def set_limit(self, per_minute):
+        """Resize the bucket to allow per_minute tokens a minute."""
+        with self.lock:
+            self.rate = per_minute / 60
+            self.capacity = per_minute
+            self.tokens = min(self.tokens, per_minute)
+    
+    def take(self, n=1):
+        """Take n tokens, sleeping until enough have accumulated."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                
+                # A request larger than the bucket only has to wait for a full one
+                needed = min(n, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return
+                wait = (needed - self.tokens) / self.rate
+            
+            # Sleep without the lock so other workers can check the bucket meanwhile
+            time.sleep(wait)
+
+_request_bucket = TokenBucket(CLAUDE_RPM_LIMIT / 60, CLAUDE_RPM_LIMIT)
+_output_token_bucket = TokenBucket(CLAUDE_OUTPUT_TPM_LIMIT / 60, CLAUDE_OUTPUT_TPM_LIMIT)
+
+def _apply_rate_limits():
+    """Size the Claude rate-limit buckets from the config (higher API tiers allow more)."""
+    config = load_whatsapp_config()
+    _request_bucket.set_limit(config.get("claude_rpm_limit", CLAUDE_RPM_LIMIT))
+    _output_token_bucket.set_limit(config.get("claude_output_tpm_limit", CLAUDE_OUTPUT_TPM_LIMIT))
+
+def _claude_cache_key(model, prompt, system=None):
+    """Hash a model/system/prompt combination for the response cache."""
+    return hashlib.blake2b(f"{model}\0{system or ''}\0{prompt}".encode('utf-8'), digest_size=16).hexdigest()
+
+def _claude_cache_get(prompt_hash):
+    """Return a cached Claude response, or None on a miss."""
+    with _db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT response FROM claude_cache WHERE prompt_hash = ?", (prompt_hash,))
+        row = cursor.fetchone()
+    
+    return row[0] if row else None
+
+def _claude_cache_put(prompt_hash, response):
+    """Store a Claude response for reuse by identical prompts."""
+    with _db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO claude_cache (prompt_hash, response, ts) VALUES (?, ?, ?)",
+            (prompt_hash, response, datetime.datetime.utcnow().isoformat())
+        )
+
+def _message_cache_key(text):
+    """Hash a message text for the per-message task cache.
+    
+    Case, punctuation, emoji and spacing are ignored, so "Please review the PR!"
+    and "please review the PR" share one cache entry.
+    """
+    normalized = " ".join(_CACHE_WORD_RE.findall(text.lower()))
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
 
-def call_claude_api(prompt, model="claude-3-5-haiku-20241022", max_tokens=500):
-    """Call the Claude API with the given prompt."""
+def _message_cache_get_many(msg_hashes):
+    """Return {msg_hash: tasks} for the hashes found in the per-message cache."""
+    found = {}
+    with _db() as conn:
+        cursor = conn.cursor()
+        for chunk in _batched(msg_hashes, 500):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT msg_hash, tasks_json FROM whatsapp_llm_cache WHERE msg_hash IN ({placeholders})",
+                chunk
+            )
+            for msg_hash, tasks_json in cursor.fetchall():
+                found[msg_hash] = _json_loads(tasks_json)
+    
+    return found
+
+def _message_cache_put_many(entries):
+    """Store (msg_hash, tasks) pairs, including empty task lists."""
+    if not entries:
+        return
+    
+    ts = int(time.time())
+    with _db() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO whatsapp_llm_cache (msg_hash, tasks_json, ts) VALUES (?, ?, ?)",
+            [(msg_hash, _json_dumps(tasks), ts) for msg_hash, tasks in entries]
+        )
+
+def prune_claude_cache(max_age_days=CLAUDE_CACHE_TTL_DAYS):
+    """Delete cached Claude responses and extracted tasks older than max_age_days."""
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)).isoformat()
+    try:
+        with _db() as conn:
+            conn.execute("DELETE FROM claude_cache WHERE ts < ?", (cutoff,))
+            conn.execute(
+                "DELETE FROM whatsapp_llm_cache WHERE ts < ?",
+                (int(time.time()) - max_age_days * 86400,)
+            )
+    except sqlite3.Error as e:
+        console.print(f"[yellow]Could not prune Claude response cache: {e}[/yellow]")
+
+def _response_text(message):
+    """Return a Messages API reply as text; a forced tool call comes back as its JSON input."""
+    for block in message["content"]:
+        if block.get("type") == "tool_use":
+            return _json_dumps(block["input"])
+    return message["content"][0]["text"]
+
+def _message_params(prompt, model, max_tokens, system=None, tool=None):
+    """Build the Messages API request body shared by direct and batched calls."""
+    params = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if system is not None:
+        # The cache breakpoint covers the tool definition and system text, which
+        # are identical on every call; only the user message varies
+        params["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+    if tool is not None:
+        params["tools"] = [tool]
+        params["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    return params
+
+def call_claude_api(prompt, model="claude-3-5-haiku-20241022", max_tokens=500, tool=None, system=None):
+    """Call the Claude API with the given prompt.
+    
+    If `tool` is given, Claude is made to call it and the tool input is
+    returned as a JSON string. A `system` prompt is sent as a cacheable prefix.
+    """
     api_key = get_api_key()
     if not api_key:
         console.print("[yellow]Claude API key not set. Using fallback methods.[/yellow]")
         return None
     
-    CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+    # Forwarded and re-scanned messages produce identical prompts
+    prompt_hash = _claude_cache_key(model, prompt, system)
+    cached = _claude_cache_get(prompt_hash)
+    if cached is not None:
+        return cached
+    
+    # Pace requests client-side so we don't burn time on 429 retries
+    _apply_rate_limits()
+    _request_bucket.take(1)
+    _output_token_bucket.take(max_tokens)
     
     headers = {
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
+        "x-api-key": api_key
     }
     
-    data = {
-        "model": model,
-        "max_tokens": max_tokens,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
+    data = _message_params(prompt, model, max_tokens, system, tool)
     
     try:
         console.print("[cyan]Analyzing messages...[/cyan]")
         
-        response = requests.post(CLAUDE_API_URL, headers=headers, json=data)
+        # The session already sends content-type: application/json
+        response = _get_session().post(
+            CLAUDE_API_URL, headers=headers, data=_json_payload(data), timeout=CLAUDE_API_TIMEOUT
+        )
         
         if response.status_code == 200:
-            result = response.json()
-            return result["content"][0]["text"]
+            text = _response_text(_json_loads(response.content))
         else:
             console.print(f"[red]API Error: {response.status_code} - {response.text}[/red]")
             return None
     except Exception as e:
         console.print(f"[red]Error calling Claude API: {str(e)}[/red]")
         return None
+    
+    _claude_cache_put(prompt_hash, text)
+    return text
+
+def submit_message_batch(prompts, model="claude-3-5-haiku-20241022", tool=None, system=None):
+    """Run (prompt, max_tokens) pairs through the Message Batches API.
+    
+    Batches are processed asynchronously at a lower price, so this polls
+    with exponential backoff until the batch ends. Returns one response text
+    per prompt, or None where no result came back.
+    """
+    results = [None] * len(prompts)
+    api_key = get_api_key()
+    if not api_key:
+        console.print("[yellow]Claude API key not set. Using fallback methods.[/yellow]")
+        return results
+    
+    # Only submit prompts that aren't already in the response cache
+    pending = {}
+    for i, (prompt, _) in enumerate(prompts):
+        cached = _claude_cache_get(_claude_cache_key(model, prompt, system))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending[f"chunk-{i}"] = i
+    
+    if not pending:
+        return results
+    
+    headers = {"x-api-key": api_key}
+    body = {
+        "requests": [
+            {
+                "custom_id": custom_id,
+                "params": _message_params(prompts[i][0], model, prompts[i][1], system, tool)
+            }
+            for custom_id, i in pending.items()
+        ]
+    }
+    session = _get_session()
+    
+    try:
+        console.print(f"[cyan]Submitting {len(pending)} prompts as a message batch...[/cyan]")
+        _apply_rate_limits()
+        _request_bucket.take(1)
+        response = session.post(CLAUDE_BATCHES_URL, headers=headers, data=_json_payload(body), timeout=CLAUDE_API_TIMEOUT)
+        if response.status_code != 200:
+            console.print(f"[red]API Error: {response.status_code} - {response.text}[/red]")
+            return results
+        batch = _json_loads(response.content)
+        
+        delay, waited = 5, 0
+        while batch.get("processing_status") != "ended":
+            if waited >= MESSAGE_BATCH_MAX_WAIT:
+                console.print(f"[yellow]Message batch {batch.get('id')} did not finish in time.[/yellow]")
+                return results
+            time.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 60)
+            
+            response = session.get(f"{CLAUDE_BATCHES_URL}/{batch['id']}", headers=headers, timeout=CLAUDE_API_TIMEOUT)
+            if response.status_code != 200:
+                console.print(f"[red]API Error: {response.status_code} - {response.text}[/red]")
+                return results
+            batch = _json_loads(response.content)
+        
+        # Results are JSON lines in no particular order, matched back by custom_id
+        response = session.get(batch["results_url"], headers=headers, timeout=CLAUDE_API_TIMEOUT)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            entry = _json_loads(line)
+            i = pending.get(entry.get("custom_id"))
+            result = entry.get("result") or {}
+            if i is None or result.get("type") != "succeeded":
+                continue
+            
+            text = _response_text(result["message"])
+            results[i] = text
+            _claude_cache_put(_claude_cache_key(model, prompts[i][0], system), text)
+    except Exception as e:
+        console.print(f"[red]Error calling Claude Message Batches API: {str(e)}[/red]")
+    
+    return results
+
+def _configure_conn(conn):
+    """Apply write-friendly PRAGMAs to a database connection.
+    
+    WAL mode is persistent in the database file, so it is enabled once by
+    _ensure_schema rather than on every connection.
+    """
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=134217728")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+def _get_conn():
+    """Open a configured connection to the application database."""
+    APP_DIR.mkdir(parents=True, exist_ok=True)
+    # Room in the statement cache for every query this module issues, since
+    # the one shared connection serves all of them
+    return _configure_conn(sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256))
+
+# One shared connection for the process; the lock serializes access from the
+# CLI and background scanner threads
+_db_conn = None
+_db_lock = threading.RLock()
+
+@contextmanager
+def _db():
+    """Yield the shared database connection while holding its lock.
+    
+    Like `with conn:`, the transaction is committed on success and rolled
+    back if the block raises.
+    """
+    global _db_conn
+    with _db_lock:
+        if _db_conn is None:
+            conn = _get_conn()
+            _ensure_schema(conn)
+            _db_conn = conn
+        try:
+            yield _db_conn
+        except BaseException:
+            if _db_conn.in_transaction:
+                _db_conn.rollback()
+            raise
+        else:
+            if _db_conn.in_transaction:
+                _db_conn.commit()
+
+def close_db():
+    """Close the shared database connection."""
+    global _db_conn
+    with _db_lock:
+        if _db_conn is not None:
+            try:
+                _db_conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            _db_conn.close()
+            _db_conn = None
+
+atexit.register(close_db)
+
+def _ensure_schema(conn):
+    """Create the WhatsApp tables, indexes and views that don't exist yet.
+    
+    Runs on the first connection of every process, so databases created by an
+    older version pick up new tables and indexes without a fresh install.
+    """
+    # WAL is stored in the database file; this is a no-op once it is set
+    conn.execute("PRAGMA journal_mode=WAL")
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS whatsapp_tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        problem_id INTEGER,
+        group_name TEXT NOT NULL,
+        sender TEXT NOT NULL,
+        message TEXT NOT NULL,
+        task_description TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        priority TEXT DEFAULT 'medium',
+        message_id TEXT, 
+        FOREIGN KEY (problem_id) REFERENCES problems (id)
+    )
+    ''')
+    
+    # Create table to track processed messages
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS whatsapp_processed_messages (
+        message_id TEXT PRIMARY KEY,
+        group_name TEXT NOT NULL,
+        sender TEXT NOT NULL,
+        processed_date TEXT NOT NULL
+    )
+    ''')
+    
+    # Memo of Claude responses keyed by a hash of model + prompt
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS claude_cache (
+        prompt_hash TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        ts TEXT NOT NULL
+    )
+    ''')
+    
+    # Extracted tasks per message text, so the same text sent again (in
+    # another group, or forwarded later) skips Claude entirely
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS whatsapp_llm_cache (
+        msg_hash TEXT PRIMARY KEY,
+        tasks_json TEXT NOT NULL,
+        ts INTEGER NOT NULL
+    )
+    ''')
+    
+    # Processed-message lookups are by message_id, which the primary key
+    # already indexes, so an older (group_name, message_id) index is dropped
+    cursor.execute("DROP INDEX IF EXISTS idx_wpm_group_msgid")
+    
+    # Index for status/priority listings
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_wtasks_status_prio
+    ON whatsapp_tasks (status, priority)
+    ''')
+    
+    # The task listing filters by status and/or problem and returns the
+    # newest rows first, so these let ORDER BY id DESC LIMIT stop early
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_wtasks_status_id
+    ON whatsapp_tasks (status, id DESC)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_wtasks_problem_id
+    ON whatsapp_tasks (problem_id, id DESC)
+    ''')
+    
+    # Lets task inserts use INSERT OR IGNORE as a last line of defense
+    # against duplicates; skipped if older duplicate rows already exist
+    try:
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_wtasks_message_id
+        ON whatsapp_tasks (message_id)
+        ''')
+    except sqlite3.IntegrityError:
+        console.print("[yellow]Duplicate WhatsApp tasks found; skipping unique message_id index.[/yellow]")
+    
+    # Pre-joined view used for task lookups so the join plan is compiled once.
+    # The problems table belongs to the main app and is missing until it has
+    # been initialized, so the view only joins it once it exists
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'problems'")
+    has_problems = cursor.fetchone() is not None
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'v_whatsapp_task_full'")
+    view = cursor.fetchone()
+    if view is None or ("JOIN problems" in view[0]) != has_problems:
+        cursor.execute("DROP VIEW IF EXISTS v_whatsapp_task_full")
+        if has_problems:
+            cursor.execute('''
+            CREATE VIEW v_whatsapp_task_full AS
+            SELECT wt.*, p.title AS problem_title
+            FROM whatsapp_tasks wt
+            LEFT JOIN problems p ON wt.problem_id = p.id
+            ''')
+        else:
+            cursor.execute('''
+            CREATE VIEW v_whatsapp_task_full AS
+            SELECT wt.*, NULL AS problem_title
+            FROM whatsapp_tasks wt
+            ''')
+    
+    conn.commit()
+    
+    # Gather planner statistics for any of our indexes that have none yet,
+    # including ones added to an existing install; close_db keeps them
+    # fresh afterwards with PRAGMA optimize
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    if cursor.fetchone() is None:
+        analyzed = set()
+    else:
+        cursor.execute("SELECT DISTINCT idx FROM sqlite_stat1 WHERE tbl = 'whatsapp_tasks'")
+        analyzed = {row[0] for row in cursor.fetchall()}
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = 'whatsapp_tasks' AND name LIKE 'idx_wtasks_%'"
+    )
+    if any(row[0] not in analyzed for row in cursor.fetchall()):
+        cursor.execute("ANALYZE whatsapp_tasks")
+        conn.commit()
 
 def init_whatsapp_integration():
     """Initialize WhatsApp integration module."""
@@ -223,6 +810,9 @@ def init_whatsapp_integration():
             "export_path": str(Path.home() / "Downloads"),
             "max_messages_per_chat": 50,  # Limit number of messages to scan per chat
             "show_qr": True,  # Show QR code in terminal for setup
+            "use_batch_api": False,  # Send large scans through the Message Batches API
+            "claude_rpm_limit": CLAUDE_RPM_LIMIT,  # Raise both limits to match your API tier
+            "claude_output_tpm_limit": CLAUDE_OUTPUT_TPM_LIMIT,
             "filters": {
                 "min_words": 5,  # Ignore very short messages
                 "ignore_media": True  # Ignore media messages when scanning
@@ -235,55 +825,73 @@ def init_whatsapp_integration():
             ]
         }
         with open(WHATSAPP_CONFIG_PATH, 'w') as f:
-            json.dump(config, f, indent=2)
-    
-    # Create tasks table in database if it doesn't exist
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS whatsapp_tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        problem_id INTEGER,
-        group_name TEXT NOT NULL,
-        sender TEXT NOT NULL,
-        message TEXT NOT NULL,
-        task_description TEXT NOT NULL,
-        timestamp TEXT NOT NULL,
-        status TEXT DEFAULT 'pending',
-        priority TEXT DEFAULT 'medium',
-        message_id TEXT, 
-        FOREIGN KEY (problem_id) REFERENCES problems (id)
-    )
-    ''')
-    
-    # Create table to track processed messages
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS whatsapp_processed_messages (
-        message_id TEXT PRIMARY KEY,
-        group_name TEXT NOT NULL,
-        sender TEXT NOT NULL,
-        processed_date TEXT NOT NULL
-    )
-    ''')
+            f.write(_json_dumps(config))
     
-    conn.commit()
-    conn.close()
+    prune_claude_cache()
     
     return load_whatsapp_config()
 
+# Raw config file contents keyed by the file's (mtime, size), so the file is
+# only re-read after it changes. Each load parses a fresh dict from the cached
+# text, which is cheaper than deep-copying a cached dict.
+_config_cache = {"key": None, "raw": None}
+
 def load_whatsapp_config():
     """Load WhatsApp integration configuration."""
-    if not WHATSAPP_CONFIG_PATH.exists():
+    try:
+        stat = WHATSAPP_CONFIG_PATH.stat()
+    except FileNotFoundError:
         return init_whatsapp_integration()
     
-    with open(WHATSAPP_CONFIG_PATH, 'r') as f:
-        return json.load(f)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _config_cache["key"] != key:
+        with open(WHATSAPP_CONFIG_PATH, 'r') as f:
+            _config_cache["raw"] = f.read()
+        _config_cache["key"] = key
+    
+    # Callers modify the config they get back, so always hand out a new dict
+    return _json_loads(_config_cache["raw"])
 
 def save_whatsapp_config(config):
     """Save WhatsApp integration configuration."""
-    with open(WHATSAPP_CONFIG_PATH, 'w') as f:
-        json.dump(config, f, indent=2)
+    raw = _json_dumps(config)
+    previous = _json_loads(_config_cache["raw"]) if _config_cache["raw"] else {}
+    
+    # Write then rename so a concurrent load never parses a half-written file
+    tmp_path = WHATSAPP_CONFIG_PATH.with_name(WHATSAPP_CONFIG_PATH.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(raw)
+    os.replace(tmp_path, WHATSAPP_CONFIG_PATH)
+    
+    stat = WHATSAPP_CONFIG_PATH.stat()
+    _config_cache["raw"] = raw
+    _config_cache["key"] = (stat.st_mtime_ns, stat.st_size)
+    
+    # Let a waiting background scanner pick up new scan settings right away
+    if any(previous.get(setting) != config.get(setting) for setting in _SCANNER_SETTINGS):
+        _scanner_wake.set()
+
+# Each selector list joined into one XPath union so a single lookup covers all of them
+_QR_CODE_XPATH = " | ".join(WHATSAPP_SELECTORS['qr_code'])
+_CHAT_LIST_XPATH = " | ".join(WHATSAPP_SELECTORS['chat_list'])
+_CHAT_SEARCH_XPATH = " | ".join(WHATSAPP_SELECTORS['chat_search'])
+_MESSAGE_XPATH = " | ".join(WHATSAPP_SELECTORS['message'])
+
+# CSS fallbacks used alongside the XPath selectors
+_MESSAGE_CSS = '.message-in, [data-testid="msg-container"]'
+_MESSAGE_TEXT_CSS = '.selectable-text, [data-testid="msg-text"]'
+_AUTHOR_CSS = '[data-testid="author"]'
+_SENDER_CANDIDATE_CSS = 'span[dir="auto"][role="button"], strong'
+_TEXT_INPUT_CSS = 'input, div[role="textbox"], div[contenteditable="true"]'
+_CHAT_ROW_CSS = '[role="row"], .chat-item, ._2aBzC'
+
+def _find_login_state(driver):
+    """WebDriverWait predicate reporting whether the chat list or QR code is shown."""
+    if driver.find_elements(By.XPATH, _CHAT_LIST_XPATH):
+        return "chat_list"
+    if driver.find_elements(By.XPATH, _QR_CODE_XPATH):
+        return "qr_code"
+    return False
 
 def test_whatsapp_connection():
     """Test the WhatsApp Web connection."""
@@ -304,8 +912,8 @@ def test_whatsapp_connection():
         browser_type = config.get("browser_type", "chrome")
         headless = False  # Always use visible mode for testing
         
-        # Initialize the browser with improved options
-        driver = initialize_webdriver(browser_type, headless, config)
+        # Reuse the running browser if there is one
+        driver = get_or_create_driver(browser_type, headless, config)
         if not driver:
             return False
         
@@ -313,74 +921,159 @@ def test_whatsapp_connection():
         driver.set_window_size(1200, 800)
         
         # Open WhatsApp Web
-        driver.get("https://web.whatsapp.com/")
+        open_whatsapp_web(driver)
         
-        # Wait for QR code or main interface with improved selectors
-        found_qr = False
+        # Wait for whichever appears first: the QR code or the chat list
         try:
-            # Try each QR code selector
-            for selector in WHATSAPP_SELECTORS['qr_code']:
-                try:
-                    qr_element = WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located((By.XPATH, selector))
-                    )
-                    found_qr = True
-                    console.print("[yellow]Please scan the QR code with your phone to authenticate.[/yellow]")
-                    console.print("[cyan]Waiting for login...[/cyan]")
-                    break
-                except TimeoutException:
-                    continue
+            login_state = WebDriverWait(driver, 30, poll_frequency=WAIT_POLL_FREQUENCY).until(_find_login_state)
+        except TimeoutException:
+            login_state = None
+        
+        if login_state == "qr_code":
+            console.print("[yellow]Please scan the QR code with your phone to authenticate.[/yellow]")
+            console.print("[cyan]Waiting for login...[/cyan]")
             
-            if found_qr:
-                # Wait for login with longer timeout
-                chat_list_found = wait_for_chat_list(driver, 120)
-                
-                if chat_list_found:
-                    console.print("[green]Successfully connected to WhatsApp Web![/green]")
-                    # Update last successful connection time
-                    config = load_whatsapp_config()
-                    config["last_successful_connection"] = datetime.datetime.now().isoformat()
-                    save_whatsapp_config(config)
-                    driver.quit()
-                    return True
-                else:
-                    console.print("[red]Timed out waiting for login. Please try again.[/red]")
-                    driver.quit()
-                    return False
+            # Wait for login with longer timeout
+            chat_list_found = wait_for_chat_list(driver, 120)
             
-        except Exception as e:
-            console.print(f"[yellow]Error waiting for QR code: {str(e)}[/yellow]")
-        
-        # If QR code not found, check if already logged in
-        chat_list_found = wait_for_chat_list(driver, 30)
+            if chat_list_found:
+                console.print("[green]Successfully connected to WhatsApp Web![/green]")
+                # Update last successful connection time
+                config = load_whatsapp_config()
+                config["last_successful_connection"] = datetime.datetime.now().isoformat()
+                save_whatsapp_config(config)
+                return True
+            else:
+                console.print("[red]Timed out waiting for login. Please try again.[/red]")
+                close_whatsapp_driver()
+                return False
         
-        if chat_list_found:
+        if login_state == "chat_list":
             console.print("[green]Already authenticated with WhatsApp Web![/green]")
             # Update last successful connection time
             config = load_whatsapp_config()
             config["last_successful_connection"] = datetime.datetime.now().isoformat()
             save_whatsapp_config(config)
-            driver.quit()
             return True
         else:
             console.print("[red]Could not connect to WhatsApp Web. Please try again.[/red]")
-            driver.quit()
+            close_whatsapp_driver()
             return False
     
     except Exception as e:
         console.print(f"[red]Error connecting to WhatsApp Web: {str(e)}[/red]")
-        if driver:
-            driver.quit()
+        close_whatsapp_driver()
         return False
 
+# Shared browser session reused across connection tests and scans
+_driver = None
+_driver_key = None
+_driver_lock = threading.Lock()
+
+def get_or_create_driver(browser_type, headless, config):
+    """Return the shared webdriver, starting a new one if needed."""
+    global _driver, _driver_key
+    
+    with _driver_lock:
+        if _driver is not None:
+            if _driver_key == (browser_type, headless):
+                try:
+                    _driver.title  # Cheap liveness probe
+                    return _driver
+                except Exception:
+                    pass
+            
+            # Browser died or was started with different settings
+            try:
+                _driver.quit()
+            except Exception:
+                pass
+            _driver = None
+        
+        _driver = initialize_webdriver(browser_type, headless, config)
+        _driver_key = (browser_type, headless)
+        return _driver
+
+def close_whatsapp_driver():
+    """Quit the shared webdriver if one is running."""
+    global _driver
+    
+    with _driver_lock:
+        if _driver is not None:
+            try:
+                _driver.quit()
+            except Exception:
+                pass
+            _driver = None
+
+atexit.register(close_whatsapp_driver)
+
+def open_whatsapp_web(driver):
+    """Navigate to WhatsApp Web unless the driver is already there."""
+    try:
+        if driver.current_url.startswith("https://web.whatsapp.com"):
+            return
+    except Exception:
+        pass
+    driver.get("https://web.whatsapp.com/")
+
+# Resolved webdriver binaries, persisted so later runs skip webdriver-manager's checks
+DRIVER_PATHS_FILE = WHATSAPP_SESSION_PATH / "driver_paths.json"
+_driver_install_paths = None
+
+def _load_driver_paths():
+    """Read the persisted driver paths, dropping any that no longer exist."""
+    try:
+        with open(DRIVER_PATHS_FILE, 'r') as f:
+            paths = _json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return {
+        browser: path for browser, path in paths.items()
+        if os.path.isfile(path) and os.access(path, os.X_OK)
+    }
+
+def _save_driver_paths():
+    try:
+        with open(DRIVER_PATHS_FILE, 'w') as f:
+            f.write(_json_dumps(_driver_install_paths))
+    except OSError:
+        pass
+
+def _install_driver(browser_type, manager_cls):
+    """Return the webdriver binary path, resolving it with webdriver-manager only when unknown."""
+    global _driver_install_paths
+    if _driver_install_paths is None:
+        _driver_install_paths = _load_driver_paths()
+    
+    path = _driver_install_paths.get(browser_type)
+    if path is None:
+        path = manager_cls().install()
+        _driver_install_paths[browser_type] = path
+        _save_driver_paths()
+    return path
+
+def _forget_driver_path(browser_type):
+    """Drop a cached driver path, e.g. after the browser was upgraded past it."""
+    if _driver_install_paths and _driver_install_paths.pop(browser_type, None):
+        _save_driver_paths()
+
 def initialize_webdriver(browser_type, headless, config):
     """Initialize and return a webdriver based on the specified browser type."""
+    if not _ensure_selenium():
+        console.print("[red]Browser automation libraries are not installed.[/red]")
+        return None
+    
     try:
         if browser_type == "chrome":
             options = webdriver.ChromeOptions()
+            options.page_load_strategy = "eager"
             if headless:
                 options.add_argument("--headless=new")
+                options.add_argument("--no-sandbox")
+                options.add_argument("--disable-dev-shm-usage")
             options.add_argument("--user-data-dir=" + str(WHATSAPP_SESSION_PATH / "chrome"))
+            options.add_argument("--profile-directory=Default")
             
             # Add additional options for stability
             for option in config.get("additional_browser_options", []):
@@ -400,8 +1093,9 @@ def initialize_webdriver(browser_type, headless, config):
             
             try:
                 # Try the newer method with Service
-                driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+                driver = webdriver.Chrome(service=Service(_install_driver("chrome", ChromeDriverManager)), options=options)
             except Exception as e:
+                _forget_driver_path("chrome")
                 console.print(f"[yellow]Error with newer ChromeDriver method: {e}. Trying fallback method...[/yellow]")
                 # Fallback to direct executable_path (for older versions)
                 try:
@@ -412,32 +1106,42 @@ def initialize_webdriver(browser_type, headless, config):
                 
         elif browser_type == "firefox":
             options = webdriver.FirefoxOptions()
+            options.page_load_strategy = "eager"
             if headless:
                 options.add_argument("--headless")
             options.add_argument("--profile")
             options.add_argument(str(WHATSAPP_SESSION_PATH / "firefox"))
             
             try:
-                driver = webdriver.Firefox(service=Service(GeckoDriverManager().install()), options=options)
+                driver = webdriver.Firefox(service=Service(_install_driver("firefox", GeckoDriverManager)), options=options)
             except Exception as e:
+                _forget_driver_path("firefox")
                 console.print(f"[red]Could not initialize Firefox driver: {e}[/red]")
                 return None
                 
         elif browser_type == "edge":
             options = webdriver.EdgeOptions()
+            options.page_load_strategy = "eager"
             if headless:
                 options.add_argument("--headless=new")
             options.add_argument("--user-data-dir=" + str(WHATSAPP_SESSION_PATH / "edge"))
+            options.add_argument("--profile-directory=Default")
             
             try:
-                driver = webdriver.Edge(service=Service(EdgeChromiumDriverManager().install()), options=options)
+                driver = webdriver.Edge(service=Service(_install_driver("edge", EdgeChromiumDriverManager)), options=options)
             except Exception as e:
+                _forget_driver_path("edge")
                 console.print(f"[red]Could not initialize Edge driver: {e}[/red]")
                 return None
         else:
             console.print(f"[red]Unsupported browser type: {browser_type}[/red]")
             return None
         
+        # Explicit waits only; an implicit wait would stack on top of them
+        driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        driver.set_script_timeout(SCRIPT_TIMEOUT)
+        driver.implicitly_wait(0)
+        
         return driver
     except Exception as e:
         console.print(f"[red]Error initializing webdriver: {e}[/red]")
@@ -445,67 +1149,241 @@ def initialize_webdriver(browser_type, headless, config):
 
 def wait_for_chat_list(driver, timeout=30):
     """Wait for the chat list to appear, indicating successful login."""
-    chat_list_found = False
-    
     try:
-        # Try various selector approaches to find chat list
-        # First try CSS class selector 
-        try:
-            WebDriverWait(driver, timeout).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div[data-testid="chat-list"]'))
-            )
-            chat_list_found = True
-            return True
-        except TimeoutException:
-            pass
-        
-        try:
-            WebDriverWait(driver, timeout).until(
-                EC.presence_of_element_located((By.CLASS_NAME, '_2AOIt'))
-            )
-            chat_list_found = True
-            return True
-        except TimeoutException:
-            pass
-        
-        # Fall back to our list of XPath selectors
-        for selector in WHATSAPP_SELECTORS['chat_list']:
-            try:
-                WebDriverWait(driver, timeout/len(WHATSAPP_SELECTORS['chat_list'])).until(
-                    EC.presence_of_element_located((By.XPATH, selector))
-                )
-                chat_list_found = True
-                return True
-            except TimeoutException:
-                continue
+        # One wait covers every chat list selector, so a missing chat list
+        # costs `timeout` once rather than once per selector
+        return _wait_for_xpath(driver, _CHAT_LIST_XPATH, timeout)
     except Exception as e:
         console.print(f"[yellow]Error while waiting for chat list: {e}[/yellow]")
+        return False
+
+def _batched(items, size):
+    """Yield successive lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _chunk_by_tokens(indexes, texts, max_tokens=MAX_PROMPT_TOKENS_PER_CLAUDE_CALL,
+                     max_messages=MAX_MESSAGES_PER_CLAUDE_CALL):
+    """Split message indexes into chunks that fit an estimated token budget.
+    
+    Tokens are estimated as len(text) // 4. A single message over the budget
+    still gets a chunk of its own.
+    """
+    chunk, chunk_tokens = [], 0
+    for i in indexes:
+        tokens = len(texts[i]) // 4 + 1
+        if chunk and (chunk_tokens + tokens > max_tokens or len(chunk) == max_messages):
+            yield chunk
+            chunk, chunk_tokens = [], 0
+        chunk.append(i)
+        chunk_tokens += tokens
+    if chunk:
+        yield chunk
+
+def _parse_batch_response(response, count):
+    """Parse a batched Claude response into one task list per message."""
+    results = [None] * count
+    text = response.strip()
+    
+    # Strip markdown code fences if Claude added them
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    
+    try:
+        if text.startswith("{"):
+            # A forced tool call gives {"results": [...]} with no prose to strip
+            entries = _json_loads(text).get("results") or []
+        else:
+            # Decode from the first '[' and stop where the array ends, so
+            # prose after it (even with brackets in it) doesn't matter
+            start = text.find('[')
+            entries = _JSON_DECODER.raw_decode(text, start)[0] if start >= 0 else []
+            
+            # A "[1] ..." marker decodes as an array too; leave those to the fallback
+            if not any(isinstance(entry, dict) for entry in entries):
+                raise ValueError("no JSON task entries")
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            index = entry.get("index")
+            if isinstance(index, int) and 1 <= index <= count:
+                tasks = entry.get("tasks") or []
+                results[index - 1] = [str(task).strip() for task in tasks if str(task).strip()]
+        return results
+    except (json.JSONDecodeError, ValueError):
+        pass
     
-    return chat_list_found
+    # Fall back to splitting the response on "[n]" markers
+    current = None
+    for line in response.split('\n'):
+        marker = _BATCH_MARKER_RE.match(line.strip())
+        if marker:
+            index = int(marker.group(1))
+            current = index - 1 if 1 <= index <= count else None
+            if current is not None:
+                results[current] = []
+            line = marker.group(2)
+        line = line.strip()
+        if current is not None and line and "NO_TASK" not in line:
+            results[current].append(line)
+    return results
 
-def extract_tasks_from_message(message_text):
-    """Extract potential tasks from a message using simple rules or Claude API."""
-    # Use Claude to extract tasks if API key is available
-    api_key = get_api_key()
+# Fixed instructions, sent as the system prompt so they form a byte-identical
+# (and therefore cacheable) prefix ahead of the varying message list
+_TASK_EXTRACTION_SYSTEM = """You extract actionable tasks and to-dos from numbered WhatsApp messages.
+Call record_tasks with one entry per message, giving its number and its tasks.
+Format each task as a single sentence describing what needs to be done. Be concise but clear.
+Use an empty "tasks" list for messages without actionable tasks."""
+
+# Forcing this tool makes Claude answer with schema-shaped JSON instead of free text
+_RECORD_TASKS_TOOL = {
+    "name": "record_tasks",
+    "description": "Record the actionable tasks found in each numbered WhatsApp message.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer", "description": "Message number"},
+                        "tasks": {"type": "array", "items": {"type": "string"}}
+                    },
+                    "required": ["index", "tasks"]
+                }
+            }
+        },
+        "required": ["results"]
+    }
+}
+
+def _build_batch_prompt(messages):
+    """Build the numbered task-extraction prompt for several messages."""
+    numbered_messages = "\n".join(f"[{i}] {text}" for i, text in enumerate(messages, 1))
+    return f"Extract the tasks from these {len(messages)} WhatsApp messages:\n\n{numbered_messages}"
+
+def call_claude_api_batch(messages):
+    """Extract tasks from several messages with a single Claude call.
+    
+    Returns one entry per message: a list of task descriptions, or None if
+    Claude did not return a usable answer for that message.
+    """
+    response = call_claude_api(
+        _build_batch_prompt(messages),
+        max_tokens=120 * len(messages),
+        tool=_RECORD_TASKS_TOOL,
+        system=_TASK_EXTRACTION_SYSTEM
+    )
+    if not response:
+        return [None] * len(messages)
     
-    if api_key:
-        prompt = f"""
-        Analyze this WhatsApp message and extract any actionable tasks or to-dos:
+    return _parse_batch_response(response, len(messages))
+
+def prefilter_messages(messages, min_words=0, ignore_media=True, text_of=lambda message: message):
+    """Drop media placeholders, short messages and repeated text before analysis.
+    
+    `text_of` extracts the message text from each item, so this works for both
+    scraped message dicts and parsed export tuples.
+    """
+    seen = set()
+    for message in messages:
+        text = text_of(message)
+        if not text:
+            continue
+        if ignore_media and _MEDIA_RE.search(text):
+            continue
+        # Count words lazily and stop at min_words instead of splitting the whole text
+        if min_words > 0 and sum(1 for _ in islice(_WORD_RE.finditer(text), min_words)) < min_words:
+            continue
         
-        "{message_text}"
+        # Forwarded and repeated messages only need to be analyzed once
+        digest = hashlib.blake2b(text.encode('utf-8', 'ignore'), digest_size=8).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
         
-        If there are no actionable tasks, respond with "NO_TASK".
-        If there are tasks, format each task as a single sentence describing what needs to be done.
-        Be concise but clear.
-        """
+        yield message
+
+def extract_tasks_from_messages(message_texts):
+    """Extract potential tasks from many messages, batching the Claude calls.
+    
+    Returns a list of task lists aligned with `message_texts`.
+    """
+    return _extract_tasks(message_texts)[0]
+
+def _extract_tasks(message_texts):
+    """Extract tasks like extract_tasks_from_messages, also reporting failures.
+    
+    Returns (task lists, unanswered), where `unanswered` holds the indexes of
+    messages sent to Claude that got no usable answer, fresh or cached. Their
+    task lists come from the rules only.
+    """
+    results = [None] * len(message_texts)
+    unanswered = set()
+    
+    # Use Claude to extract tasks if API key is available, but only for
+    # messages that look task-like; the rules below still cover the rest
+    if get_api_key():
+        candidates = [i for i, text in enumerate(message_texts) if has_task_keyword(text)]
+        
+        # Reuse earlier answers for message texts Claude has already seen
+        msg_hashes = {i: _message_cache_key(message_texts[i]) for i in candidates}
+        cached = _message_cache_get_many(list(set(msg_hashes.values())))
+        for i in candidates:
+            results[i] = cached.get(msg_hashes[i])
+        candidates = [i for i in candidates if results[i] is None]
+        
+        batches = list(_chunk_by_tokens(candidates, message_texts))
+        
+        if len(batches) > 1 and load_whatsapp_config().get("use_batch_api", False):
+            # Several chunks: submit them together as one asynchronous batch
+            prompts = [
+                (_build_batch_prompt([message_texts[i] for i in batch]), 120 * len(batch))
+                for batch in batches
+            ]
+            responses = submit_message_batch(prompts, tool=_RECORD_TASKS_TOOL, system=_TASK_EXTRACTION_SYSTEM)
+            for batch, response in zip(batches, responses):
+                batch_results = _parse_batch_response(response, len(batch)) if response else [None] * len(batch)
+                for i, tasks in zip(batch, batch_results):
+                    results[i] = tasks
+        elif batches:
+            # Chunks are independent, so send them concurrently; the token
+            # buckets in call_claude_api still keep us under the rate limits
+            with ThreadPoolExecutor(max_workers=min(MAX_SCAN_WORKERS, len(batches))) as executor:
+                chunk_results = executor.map(
+                    call_claude_api_batch,
+                    [[message_texts[i] for i in batch] for batch in batches]
+                )
+                for batch, batch_results in zip(batches, chunk_results):
+                    for i, tasks in zip(batch, batch_results):
+                        results[i] = tasks
         
-        response = call_claude_api(prompt, max_tokens=200)
-        if response and response.strip() and "NO_TASK" not in response:
-            # Extract and clean task descriptions
-            tasks = [task.strip() for task in response.split('\n') if task.strip()]
-            return tasks
+        # Empty task lists are cached too, so no-task messages aren't re-sent
+        _message_cache_put_many([(msg_hashes[i], results[i]) for i in candidates if results[i] is not None])
+        unanswered = {i for i in candidates if results[i] is None}
     
     # Fallback to rule-based extraction
+    for i, text in enumerate(message_texts):
+        if not results[i]:
+            results[i] = extract_tasks_with_rules(text)
+    
+    return results, unanswered
+
+def extract_tasks_from_message(message_text):
+    """Extract potential tasks from a message using simple rules or Claude API."""
+    return extract_tasks_from_messages([message_text])[0]
+
+def extract_tasks_with_rules(message_text):
+    """Extract potential tasks from a message using simple rules."""
     potential_tasks = []
     
     # Simple rule-based extraction
@@ -514,39 +1392,100 @@ def extract_tasks_from_message(message_text):
         line = line.strip()
         
         # Check for task indicators
-        if (line.startswith("- ") or 
-            line.startswith("* ") or 
-            line.startswith("• ") or
-            line.startswith("todo:") or
-            line.startswith("to do:") or
-            line.startswith("task:") or
-            re.search(r"^\d+\.\s", line) or  # "1. Do something"
-            "please" in line.lower() or
-            "can you" in line.lower()):
+        if (line.startswith(_TASK_PREFIXES) or
+            _NUMBERED_ITEM_RE.match(line) or  # "1. Do something"
+            _REQUEST_PHRASE_RE.search(line)):
             
             # Clean up the task
-            task = line
-            for prefix in ["- ", "* ", "• ", "todo:", "to do:", "task:"]:
-                if task.lower().startswith(prefix):
-                    task = task[len(prefix):].strip()
+            task = _TASK_PREFIX_RE.sub("", line)
             
             # Remove numbered prefix like "1. "
-            task = re.sub(r"^\d+\.\s+", "", task)
+            task = _NUMBERED_ITEM_RE.sub("", task)
             
             if len(task.split()) >= 3:  # At least 3 words
                 potential_tasks.append(task)
     
     # If no structured tasks found, check for action verbs at beginning
     if not potential_tasks:
-        action_verbs = ["check", "review", "create", "update", "send", "prepare", "schedule", "call", "verify", "complete"]
         for line in lines:
             words = line.strip().lower().split()
-            if words and words[0] in action_verbs and len(words) >= 3:
+            if words and words[0] in _ACTION_VERBS and len(words) >= 3:
                 potential_tasks.append(line.strip())
     
     return potential_tasks
 
+def _stable_hash(text):
+    """Short hash of text that is the same in every process, unlike hash()."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+def _message_key(group_name, sender, text, time=''):
+    """Build the ID that identifies a message within a group."""
+    return f"{group_name}|{sender}|{time}|{_stable_hash(text)}"
+
+def _filter_unprocessed(group_name, message_infos):
+    """Tag message infos with their message ID and drop already-processed ones."""
+    for info in message_infos:
+        info['message_id'] = _message_key(group_name, info['sender'], info['text'], info.get('time', ''))
+    
+    done = already_processed([info['message_id'] for info in message_infos])
+    return [info for info in message_infos if info['message_id'] not in done]
+
+def _processed_rows(group_name, message_infos):
+    """Build whatsapp_processed_messages rows for analyzed messages."""
+    processed_date = datetime.datetime.now().isoformat()
+    return [(info['message_id'], group_name, info['sender'], processed_date) for info in message_infos]
+
+def _tasks_from_message_infos(group_name, message_infos):
+    """Run task extraction for one group's messages and build task dicts.
+    
+    Returns (task dicts, analyzed message infos). Messages Claude failed to
+    answer are left out of the latter so the next scan retries them.
+    """
+    group_tasks = []
+    task_lists, unanswered = _extract_tasks([info['text'] for info in message_infos])
+    analyzed = [info for i, info in enumerate(message_infos) if i not in unanswered]
+    now = datetime.datetime.now().isoformat()
+    
+    for message_info, tasks in zip(message_infos, task_lists):
+        for task in tasks:
+            group_tasks.append({
+                'message_id': message_info['message_id'] + f"|{_stable_hash(task)}",
+                'sender': message_info['sender'],
+                'original_message': message_info['text'],
+                'task_description': task,
+                'timestamp': message_info.get('timestamp') or now,
+                'group_name': group_name
+            })
+    
+    return group_tasks, analyzed
+
+def _has_recent_login(config):
+    """Return True if WhatsApp Web was logged in recently enough to reuse the session."""
+    last = config.get("last_successful_connection")
+    if not last:
+        return False
+    try:
+        age = datetime.datetime.now() - datetime.datetime.fromisoformat(last)
+    except ValueError:
+        return False
+    return age.days < WHATSAPP_SESSION_MAX_AGE_DAYS
+
+# Only one scan runs at a time; a trigger that arrives while one is running is
+# coalesced into it rather than driving the same browser session twice
+_scan_lock = threading.Lock()
+
 def scan_whatsapp_messages(problem_id=None, use_export=False):
+    """Scan WhatsApp messages for tasks, skipping overlapping scan requests."""
+    if not _scan_lock.acquire(blocking=False):
+        console.print("[yellow]A WhatsApp scan is already running; skipping this one.[/yellow]")
+        return False
+    
+    try:
+        return _scan_whatsapp_messages(problem_id, use_export)
+    finally:
+        _scan_lock.release()
+
+def _scan_whatsapp_messages(problem_id=None, use_export=False):
     """Scan WhatsApp messages for tasks with improved reliability."""
     config = load_whatsapp_config()
     
@@ -562,18 +1501,23 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
         return use_fallback_method(problem_id)
     
     browser_type = config.get("browser_type", "chrome")
-    headless = config.get("headless", False)
+    # A persisted, recently linked session doesn't need a visible browser
+    auto_headless = not config.get("headless", False) and _has_recent_login(config)
+    headless = config.get("headless", False) or auto_headless
     monitored_groups = config.get("monitored_groups", [])
     max_messages = config.get("max_messages_per_chat", 50)
     min_words = config.get("filters", {}).get("min_words", 5)
+    ignore_media = config.get("filters", {}).get("ignore_media", True)
     
     if not monitored_groups:
         console.print("[yellow]No groups configured for monitoring. Use 'configure-whatsapp' to add groups.[/yellow]")
         return False
     
+    load_processed_message_ids()
+    
     driver = None
     try:
-        driver = initialize_webdriver(browser_type, headless, config)
+        driver = get_or_create_driver(browser_type, headless, config)
         if not driver:
             return use_fallback_method(problem_id)
         
@@ -581,22 +1525,39 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
         driver.set_window_size(1200, 800)
         
         # Open WhatsApp Web
-        driver.get("https://web.whatsapp.com/")
+        open_whatsapp_web(driver)
         
         # Check if we're logged in by waiting for chat list
         chat_list_found = wait_for_chat_list(driver, 30)
         
+        if not chat_list_found and auto_headless:
+            # The session may have expired; retry once with a visible browser
+            console.print("[yellow]Headless session not logged in, retrying with a visible browser...[/yellow]")
+            config.pop("last_successful_connection", None)
+            save_whatsapp_config(config)
+            close_whatsapp_driver()
+            
+            driver = get_or_create_driver(browser_type, False, config)
+            if not driver:
+                return use_fallback_method(problem_id)
+            driver.set_window_size(1200, 800)
+            open_whatsapp_web(driver)
+            chat_list_found = wait_for_chat_list(driver, 30)
+        
         if not chat_list_found:
             console.print("[red]Failed to load WhatsApp Web or not logged in. Please run 'test-whatsapp-connection' first.[/red]")
-            driver.quit()
+            close_whatsapp_driver()
             return False
         
-        # Wait for everything to load
-        time.sleep(5)
+        config["last_successful_connection"] = datetime.datetime.now().isoformat()
         
         all_tasks = []
+        analyzed_rows = []
+        pending_groups = {}
         
-        with Progress(
+        # The browser session is shared, so DOM work stays on this thread while
+        # each group's Claude analysis runs in the pool during the next scrape
+        with ThreadPoolExecutor(max_workers=min(MAX_SCAN_WORKERS, len(monitored_groups))) as executor, Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             transient=True,
@@ -617,8 +1578,8 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                         console.print(f"[yellow]Could not find search box for group: {group_name}[/yellow]")
                         continue
                     
-                    # Wait after search to ensure results are loaded
-                    time.sleep(2)
+                    # Wait for the group to show up in the search results
+                    wait_for_search_results(driver, group_name)
                     
                     # Try clicking on the group with multiple approaches
                     group_found = click_on_contact_or_group(driver, group_name)
@@ -631,7 +1592,7 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                                 try:
                                     back_button = driver.find_element(By.XPATH, back_selector)
                                     back_button.click()
-                                    time.sleep(1)
+                                    _wait_for_xpath(driver, _CHAT_SEARCH_XPATH, 5)
                                     break
                                 except (NoSuchElementException, ElementClickInterceptedException):
                                     continue
@@ -640,7 +1601,7 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                         continue
                     
                     # Wait for messages to load
-                    time.sleep(3)
+                    wait_for_messages(driver)
                     
                     # Extract messages with multiple approaches
                     messages = extract_messages(driver, max_messages)
@@ -653,7 +1614,7 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                                 try:
                                     back_button = driver.find_element(By.XPATH, back_selector)
                                     back_button.click()
-                                    time.sleep(1)
+                                    _wait_for_xpath(driver, _CHAT_SEARCH_XPATH, 5)
                                     break
                                 except (NoSuchElementException, ElementClickInterceptedException):
                                     continue
@@ -663,35 +1624,21 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                     
                     progress.update(task, description=f"[cyan]Processing {len(messages)} messages from {group_name}[/cyan]")
                     
-                    # Process each message
-                    for message_element in messages:
-                        try:
-                            # Extract message text and sender with multiple approaches
-                            message_info = extract_message_info(message_element)
-                            
-                            if not message_info['text'] or len(message_info['text'].split()) < min_words:
-                                continue
-                            
-                            # Generate a unique message ID
-                            message_id = f"{group_name}_{message_info['sender']}_{hash(message_info['text'])}"
-                            
-                            # Extract tasks from message
-                            tasks = extract_tasks_from_message(message_info['text'])
-                            
-                            if tasks:
-                                for task in tasks:
-                                    all_tasks.append({
-                                        'message_id': message_id + f"_{hash(task)}",
-                                        'sender': message_info['sender'],
-                                        'original_message': message_info['text'],
-                                        'task_description': task,
-                                        'timestamp': datetime.datetime.now().isoformat(),
-                                        'group_name': group_name
-                                    })
-                        
-                        except Exception as e:
-                            console.print(f"[yellow]Error processing message: {str(e)}[/yellow]")
-                            continue
+                    # Collect every message first so the whole chat is analyzed in batches
+                    message_infos = extract_message_infos(driver, messages)
+                    
+                    message_infos = list(prefilter_messages(
+                        message_infos, min_words, ignore_media, text_of=itemgetter('text')
+                    ))
+                    
+                    # Messages seen in earlier scans don't need another analysis
+                    message_infos = _filter_unprocessed(group_name, message_infos)
+                    
+                    # Extract tasks from messages in the background
+                    if message_infos:
+                        pending_groups[group_name] = executor.submit(
+                            _tasks_from_message_infos, group_name, message_infos
+                        )
                     
                     # Go back to the chat list
                     try:
@@ -699,7 +1646,7 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                             try:
                                 back_button = driver.find_element(By.XPATH, back_selector)
                                 back_button.click()
-                                time.sleep(1)
+                                _wait_for_xpath(driver, _CHAT_SEARCH_XPATH, 5)
                                 break
                             except (NoSuchElementException, ElementClickInterceptedException):
                                 continue
@@ -718,15 +1665,19 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
                         pass
                 
                 progress.update(task, advance=1)
+            
+            progress.update(task, description="[cyan]Analyzing messages for tasks...[/cyan]")
+            for group_name, future in pending_groups.items():
+                try:
+                    group_tasks, analyzed = future.result()
+                    all_tasks.extend(group_tasks)
+                    analyzed_rows.extend(_processed_rows(group_name, analyzed))
+                except Exception as e:
+                    console.print(f"[yellow]Error analyzing group {group_name}: {str(e)}[/yellow]")
         
-        driver.quit()
-        
-        # Save extracted tasks
-        tasks_added = 0
-        if all_tasks:
-            for task in all_tasks:
-                added = save_tasks_to_db([task], task['group_name'])
-                tasks_added += added
+        # Save extracted tasks, then remember which messages were analyzed
+        tasks_added = save_tasks_to_db(all_tasks)
+        mark_messages_processed(analyzed_rows)
         
         # Update last scan time
         config["last_scan_time"] = datetime.datetime.now().isoformat()
@@ -745,8 +1696,7 @@ def scan_whatsapp_messages(problem_id=None, use_export=False):
     
     except Exception as e:
         console.print(f"[red]Error scanning WhatsApp messages: {str(e)}[/red]")
-        if driver:
-            driver.quit()
+        close_whatsapp_driver()
         return use_fallback_method(problem_id)
 
 def find_and_interact_with_search_box(driver, search_text):
@@ -754,13 +1704,12 @@ def find_and_interact_with_search_box(driver, search_text):
     # Try multiple search approaches
     for selector in WHATSAPP_SELECTORS['chat_search']:
         try:
-            search_box = WebDriverWait(driver, 5).until(
+            search_box = WebDriverWait(driver, 5, poll_frequency=WAIT_POLL_FREQUENCY).until(
                 EC.presence_of_element_located((By.XPATH, selector))
             )
             
             # Clear any existing search
             search_box.clear()
-            time.sleep(0.5)
             
             # Enter search text with different methods
             try:
@@ -778,7 +1727,6 @@ def find_and_interact_with_search_box(driver, search_text):
                     actions.send_keys(search_text)
                     actions.perform()
             
-            time.sleep(2)  # Wait for search results
             return True
             
         except (TimeoutException, NoSuchElementException, ElementClickInterceptedException, ElementNotInteractableException):
@@ -786,13 +1734,12 @@ def find_and_interact_with_search_box(driver, search_text):
     
     # One more approach - look for any input field or search icon
     try:
-        inputs = driver.find_elements(By.CSS_SELECTOR, 'input, div[role="textbox"], div[contenteditable="true"]')
+        inputs = driver.find_elements(By.CSS_SELECTOR, _TEXT_INPUT_CSS)
         for input_elem in inputs:
             try:
                 if input_elem.is_displayed():
                     input_elem.clear()
                     input_elem.send_keys(search_text)
-                    time.sleep(2)
                     return True
             except Exception:
                 continue
@@ -801,17 +1748,33 @@ def find_and_interact_with_search_box(driver, search_text):
     
     return False
 
+def _wait_for_xpath(driver, xpath, timeout):
+    """Wait until any element matches `xpath`; return False on timeout."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_FREQUENCY).until(lambda d: d.find_elements(By.XPATH, xpath))
+        return True
+    except TimeoutException:
+        return False
+
+def wait_for_search_results(driver, name, timeout=5):
+    """Wait until a chat matching `name` appears in the search results."""
+    xpath = " | ".join(selector.format(name) for selector in WHATSAPP_SELECTORS['contact_by_name'])
+    return _wait_for_xpath(driver, xpath, timeout)
+
+def wait_for_messages(driver, timeout=10):
+    """Wait until the opened chat has rendered its messages."""
+    return _wait_for_xpath(driver, _MESSAGE_XPATH, timeout)
+
 def click_on_contact_or_group(driver, name):
     """Click on a contact or group using multiple approaches."""
     # Try templated selectors
     for selector_template in WHATSAPP_SELECTORS['contact_by_name']:
         try:
             selector = selector_template.format(name)
-            contact_element = WebDriverWait(driver, 5).until(
+            contact_element = WebDriverWait(driver, 5, poll_frequency=WAIT_POLL_FREQUENCY).until(
                 EC.element_to_be_clickable((By.XPATH, selector))
             )
             contact_element.click()
-            time.sleep(2)  # Wait after click
             return True
         except (TimeoutException, NoSuchElementException, ElementClickInterceptedException):
             continue
@@ -829,7 +1792,6 @@ def click_on_contact_or_group(driver, name):
                         if parent.tag_name == 'div':
                             try:
                                 parent.click()
-                                time.sleep(2)
                                 return True
                             except Exception:
                                 # Continue with parent traversal
@@ -843,7 +1805,6 @@ def click_on_contact_or_group(driver, name):
                     # Try direct click if parent navigation didn't work
                     try:
                         element.click()
-                        time.sleep(2)
                         return True
                     except Exception:
                         pass
@@ -854,14 +1815,13 @@ def click_on_contact_or_group(driver, name):
     
     # Try another approach - any clickable row after search
     try:
-        rows = driver.find_elements(By.CSS_SELECTOR, '[role="row"], .chat-item, ._2aBzC')
+        rows = driver.find_elements(By.CSS_SELECTOR, _CHAT_ROW_CSS)
         if rows:
             # Try to click the first visible row
             for row in rows:
                 try:
                     if row.is_displayed():
                         row.click()
-                        time.sleep(2)
                         return True
                 except Exception:
                     continue
@@ -887,7 +1847,7 @@ def extract_messages(driver, max_messages=50):
     # Different approaches to find messages
     try:
         # Approach 1: Direct class selector
-        elements = driver.find_elements(By.CSS_SELECTOR, '.message-in, [data-testid="msg-container"]')
+        elements = driver.find_elements(By.CSS_SELECTOR, _MESSAGE_CSS)
         if elements:
             messages = elements[-min(max_messages, len(elements)):]
             return messages
@@ -912,7 +1872,7 @@ def extract_messages(driver, max_messages=50):
     
     # Approach 3: Try with general message patterns
     try:
-        elements = driver.find_elements(By.CSS_SELECTOR, '.selectable-text, [data-testid="msg-text"]')
+        elements = driver.find_elements(By.CSS_SELECTOR, _MESSAGE_TEXT_CSS)
         if elements:
             # Group by parent to get actual message containers
             grouped_messages = {}
@@ -941,6 +1901,78 @@ def extract_messages(driver, max_messages=50):
     
     return messages
 
+# Resolves text, sender and time for every message element inside the browser,
+# using the same selector fallbacks as extract_message_info, in a single round trip
+_JS_MESSAGE_INFOS = """
+const [elements, textSelectors, senderSelectors, timeSelectors, textCss, authorCss, senderCandidateCss] = arguments;
+const matches = (xpath, node) => {
+    const result = document.evaluate(xpath, node, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const nodes = [];
+    for (let i = 0; i < result.snapshotLength; i++) nodes.push(result.snapshotItem(i));
+    return nodes;
+};
+const textOf = node => (node.innerText || '').trim();
+return elements.map(el => {
+    let text = '';
+    for (const xpath of textSelectors) {
+        const parts = matches(xpath, el).map(textOf).filter(Boolean);
+        if (parts.length) { text = parts.join(' '); break; }
+    }
+    if (!text) {
+        text = Array.from(el.querySelectorAll(textCss))
+            .map(textOf).filter(Boolean).join(' ');
+    }
+    if (!text) text = textOf(el);
+
+    let sender = 'Unknown';
+    for (const xpath of senderSelectors) {
+        const found = matches(xpath, el);
+        if (found.length && textOf(found[0])) { sender = textOf(found[0]); break; }
+    }
+    if (sender === 'Unknown') {
+        const author = el.querySelector(authorCss);
+        if (author && textOf(author)) sender = textOf(author);
+    }
+    if (sender === 'Unknown') {
+        for (const bold of el.querySelectorAll(senderCandidateCss)) {
+            const name = textOf(bold);
+            if (name && name.length < 30) { sender = name; break; }
+        }
+    }
+    let time = '';
+    for (const xpath of timeSelectors) {
+        const found = matches(xpath, el);
+        if (found.length && textOf(found[0])) { time = textOf(found[0]); break; }
+    }
+    return {text: text, sender: sender, time: time};
+});
+"""
+
+def extract_message_infos(driver, message_elements):
+    """Extract text, sender and time for all message elements with one script call."""
+    try:
+        return driver.execute_script(
+            _JS_MESSAGE_INFOS,
+            message_elements,
+            WHATSAPP_SELECTORS['message_text'],
+            WHATSAPP_SELECTORS['message_sender'],
+            WHATSAPP_SELECTORS['message_time'],
+            _MESSAGE_TEXT_CSS,
+            _AUTHOR_CSS,
+            _SENDER_CANDIDATE_CSS
+        )
+    except Exception as e:
+        console.print(f"[yellow]Batch message extraction failed ({e}), reading messages one by one...[/yellow]")
+    
+    message_infos = []
+    for message_element in message_elements:
+        try:
+            message_infos.append(extract_message_info(message_element))
+        except Exception as e:
+            console.print(f"[yellow]Error processing message: {str(e)}[/yellow]")
+    
+    return message_infos
+
 def extract_message_info(message_element):
     """Extract text, sender, and time from a message element using multiple approaches."""
     message_info = {
@@ -964,7 +1996,7 @@ def extract_message_info(message_element):
         # Approach 2: Direct CSS selectors
         if not message_info['text']:
             try:
-                text_elements = message_element.find_elements(By.CSS_SELECTOR, '.selectable-text, [data-testid="msg-text"]')
+                text_elements = message_element.find_elements(By.CSS_SELECTOR, _MESSAGE_TEXT_CSS)
                 if text_elements:
                     message_info['text'] = " ".join([el.text for el in text_elements if el.text])
             except Exception:
@@ -991,7 +2023,7 @@ def extract_message_info(message_element):
         # Try data-testid attribute
         if message_info['sender'] == 'Unknown':
             try:
-                author = message_element.find_element(By.CSS_SELECTOR, '[data-testid="author"]')
+                author = message_element.find_element(By.CSS_SELECTOR, _AUTHOR_CSS)
                 if author and author.text:
                     message_info['sender'] = author.text
             except Exception:
@@ -1000,7 +2032,7 @@ def extract_message_info(message_element):
         # Try to find a bold element which may be the sender
         if message_info['sender'] == 'Unknown':
             try:
-                bold_elements = message_element.find_elements(By.CSS_SELECTOR, 'span[dir="auto"][role="button"], strong')
+                bold_elements = message_element.find_elements(By.CSS_SELECTOR, _SENDER_CANDIDATE_CSS)
                 for el in bold_elements:
                     if el.text and len(el.text) < 30:  # Sender names should be relatively short
                         message_info['sender'] = el.text
@@ -1012,10 +2044,66 @@ def extract_message_info(message_element):
     
     return message_info
 
+# strptime format for an export timestamp, keyed by (4-digit year, has seconds, 12-hour clock)
+_EXPORT_TIME_FORMATS = {
+    (year4, seconds, twelve_hour): "%d/%m/{}, {}:%M{}{}".format(
+        "%Y" if year4 else "%y",
+        "%I" if twelve_hour else "%H",
+        ":%S" if seconds else "",
+        " %p" if twelve_hour else ""
+    )
+    for year4 in (False, True)
+    for seconds in (False, True)
+    for twelve_hour in (False, True)
+}
+
+def parse_export_timestamp(stamp):
+    """Convert an export timestamp to ISO format, or return None if it can't be parsed."""
+    stamp = stamp.replace('\u202f', ' ')
+    twelve_hour = stamp[-2:].lower() in ('am', 'pm')
+    if twelve_hour:
+        stamp = stamp[:-2].rstrip() + ' ' + stamp[-2:].upper()
+    
+    date_part, _, time_part = stamp.partition(', ')
+    key = (len(date_part.rsplit('/', 1)[-1]) == 4, time_part.count(':') == 2, twelve_hour)
+    
+    try:
+        return datetime.datetime.strptime(stamp, _EXPORT_TIME_FORMATS[key]).isoformat()
+    except ValueError:
+        return None
+
+def iter_export_messages(path):
+    """Yield (timestamp, sender, message) tuples from a WhatsApp export file.
+    
+    The file is read line by line. Lines without a timestamp are treated as
+    continuations of the previous message.
+    """
+    current = None
+    
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = _EXPORT_TIMESTAMP_RE.match(line)
+            if match:
+                if current:
+                    yield tuple(current)
+                
+                # System notices ("Messages are end-to-end encrypted") have no sender
+                sender, separator, body = line[match.end():].partition(': ')
+                body = body.strip()
+                current = [match.group(1), sender.strip(), body] if separator and body else None
+            elif current:
+                current[2] += '\n' + line.rstrip('\n')
+    
+    if current:
+        yield tuple(current)
+
 def scan_from_exported_chats(problem_id=None):
     """Scan exported WhatsApp chat files for tasks."""
     config = load_whatsapp_config()
     export_path = Path(config.get("export_path", str(Path.home() / "Downloads")))
+    max_messages = config.get("max_messages_per_chat", 50)
+    min_words = config.get("filters", {}).get("min_words", 5)
+    ignore_media = config.get("filters", {}).get("ignore_media", True)
     
     if not export_path.exists():
         console.print(f"[red]Export path does not exist: {export_path}[/red]")
@@ -1033,7 +2121,9 @@ def scan_from_exported_chats(problem_id=None):
     
     console.print(f"[cyan]Found {len(export_files)} WhatsApp chat export files.[/cyan]")
     
-    all_tasks = []
+    load_processed_message_ids()
+    
+    tasks_added = 0
     
     for file_path in export_files:
         try:
@@ -1042,43 +2132,33 @@ def scan_from_exported_chats(problem_id=None):
             # Extract group name from file name
             group_name = file_path.stem.replace("WhatsApp Chat with ", "")
             
-            # Read the file
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Parse messages - typical format: [DD/MM/YY, HH:MM:SS] Sender: Message
-            message_pattern = r'\[(\d{2}/\d{2}/\d{2}, \d{2}:\d{2}:\d{2})\] ([^:]+): (.+)'
-            matches = re.findall(message_pattern, content, re.MULTILINE)
-            
-            for timestamp, sender, message_text in matches:
-                # Generate a unique message ID
-                message_id = f"{group_name}_{sender}_{hash(message_text)}"
+            # Stream the file, keeping only the most recent messages like the
+            # browser scan does, so large exports aren't held in memory
+            recent = deque(iter_export_messages(file_path), maxlen=max_messages)
+            messages = prefilter_messages(recent, min_words, ignore_media, text_of=itemgetter(2))
+            for chunk in _batched(messages, EXPORT_CHUNK_SIZE):
+                message_infos = _filter_unprocessed(group_name, [
+                    {
+                        'text': message_text,
+                        'sender': sender,
+                        'time': timestamp,
+                        'timestamp': parse_export_timestamp(timestamp)
+                    }
+                    for timestamp, sender, message_text in chunk
+                ])
+                if not message_infos:
+                    continue
                 
-                # Extract tasks from message
-                tasks = extract_tasks_from_message(message_text)
+                # Extract tasks from messages
+                chunk_tasks, analyzed = _tasks_from_message_infos(group_name, message_infos)
                 
-                if tasks:
-                    for task in tasks:
-                        all_tasks.append({
-                            'message_id': message_id + f"_{hash(task)}",
-                            'sender': sender,
-                            'original_message': message_text,
-                            'task_description': task,
-                            'timestamp': datetime.datetime.now().isoformat(),
-                            'group_name': group_name
-                        })
+                # Save extracted tasks, then remember which messages were analyzed
+                tasks_added += save_tasks_to_db(chunk_tasks)
+                mark_messages_processed(_processed_rows(group_name, analyzed))
         
         except Exception as e:
             console.print(f"[yellow]Error processing export file {file_path.name}: {str(e)}[/yellow]")
     
-    # Save extracted tasks
-    tasks_added = 0
-    if all_tasks:
-        # Save tasks for each group
-        for task in all_tasks:
-            added = save_tasks_to_db([task], task['group_name'])
-            tasks_added += added
-    
     # Update last scan time
     config["last_scan_time"] = datetime.datetime.now().isoformat()
     save_whatsapp_config(config)
@@ -1099,54 +2179,53 @@ def use_fallback_method(problem_id=None):
     console.print("[yellow]Using fallback task extraction method.[/yellow]")
     
     # Create some sample fallback tasks with more variety
+    now = datetime.datetime.now().isoformat()
+    stamp = int(time.time())
     fallback_tasks = [
         {
-            'message_id': f"fallback_1_{int(time.time())}",
+            'message_id': f"fallback_1_{stamp}",
             'sender': "System",
             'original_message': "Please check our project progress and update the timeline.",
             'task_description': "Check project progress and update timeline",
-            'timestamp': datetime.datetime.now().isoformat(),
+            'timestamp': now,
             'group_name': "Fallback Group"
         },
         {
-            'message_id': f"fallback_2_{int(time.time())}",
+            'message_id': f"fallback_2_{stamp}",
             'sender': "System",
             'original_message': "Don't forget to prepare for tomorrow's meeting with the client.",
             'task_description': "Prepare for tomorrow's client meeting",
-            'timestamp': datetime.datetime.now().isoformat(),
+            'timestamp': now,
             'group_name': "Fallback Group"
         },
         {
-            'message_id': f"fallback_3_{int(time.time())}",
+            'message_id': f"fallback_3_{stamp}",
             'sender': "System",
             'original_message': "We need to review the latest feedback from the design team.",
             'task_description': "Review design team feedback",
-            'timestamp': datetime.datetime.now().isoformat(),
+            'timestamp': now,
             'group_name': "Fallback Group"
         },
         {
-            'message_id': f"fallback_4_{int(time.time())}",
+            'message_id': f"fallback_4_{stamp}",
             'sender': "System",
             'original_message': "Can you send the updated proposal to the marketing department by EOD?",
             'task_description': "Send updated proposal to marketing by EOD",
-            'timestamp': datetime.datetime.now().isoformat(),
+            'timestamp': now,
             'group_name': "Project Updates"
         },
         {
-            'message_id': f"fallback_5_{int(time.time())}",
+            'message_id': f"fallback_5_{stamp}",
             'sender': "System",
             'original_message': "Remember to update the KPIs for the Q2 report.",
             'task_description': "Update KPIs for Q2 report",
-            'timestamp': datetime.datetime.now().isoformat(),
+            'timestamp': now,
             'group_name': "Project Updates"
         }
     ]
     
     # Save the tasks
-    tasks_added = 0
-    for task in fallback_tasks:
-        added = save_tasks_to_db([task], task['group_name'])
-        tasks_added += added
+    tasks_added = save_tasks_to_db(fallback_tasks)
     
     # Assign to problem if specified
     if problem_id is not None and tasks_added > 0:
@@ -1160,158 +2239,225 @@ def use_fallback_method(problem_id=None):
         console.print("[red]Failed to create fallback tasks.[/red]")
         return False
 
-def save_tasks_to_db(tasks, group_name):
+def save_tasks_to_db(tasks, group_name=None):
     """Save extracted tasks to the database."""
     if not tasks:
         return 0
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    rows = [
+        (
+            task.get('problem_id'),
+            task.get('group_name', group_name),
+            task['sender'],
+            task['original_message'],
+            task['task_description'],
+            task['timestamp'],
+            'pending',
+            task.get('priority', 'medium'),
+            task['message_id']
+        )
+        for task in tasks
+    ]
+    
+    return bulk_insert_tasks(rows)
+
+# In-memory copy of processed message IDs, loaded at the start of a scan
+_processed_ids = None
+
+def load_processed_message_ids():
+    """Load all processed message IDs so known messages are skipped without SQL."""
+    global _processed_ids
     
-    new_tasks_count = 0
+    with _db() as conn:
+        cursor = conn.execute("SELECT message_id FROM whatsapp_processed_messages")
+        _processed_ids = {row[0] for row in cursor}
     
-    for task in tasks:
-        # Check if this message has already been processed
+    return _processed_ids
+
+def _find_processed_message_ids(cursor, message_ids):
+    """Return the subset of message_ids already processed.
+    
+    Message IDs embed the group name, so the primary key alone answers this.
+    """
+    found = set()
+    
+    # Stay well under SQLite's bound-parameter limit
+    for chunk in _batched(message_ids, 500):
+        placeholders = ",".join("?" * len(chunk))
         cursor.execute(
-            "SELECT message_id FROM whatsapp_processed_messages WHERE message_id = ?",
-            (task['message_id'],)
+            f"SELECT message_id FROM whatsapp_processed_messages "
+            f"WHERE message_id IN ({placeholders})",
+            chunk
         )
+        found.update(row[0] for row in cursor.fetchall())
+    
+    return found
+
+def already_processed(message_ids):
+    """Return the subset of message_ids already processed.
+    
+    IDs in the in-memory set are answered without SQL; the rest are checked
+    with chunked IN queries.
+    """
+    known = _processed_ids if _processed_ids is not None else ()
+    found = {message_id for message_id in message_ids if message_id in known}
+    unknown = [message_id for message_id in message_ids if message_id not in found]
+    
+    if unknown:
+        with _db() as conn:
+            found |= _find_processed_message_ids(conn.cursor(), unknown)
+    
+    return found
+
+def mark_messages_processed(rows, cursor=None):
+    """Record processed messages in one statement.
+    
+    Each row is (message_id, group_name, sender, processed_date). When a cursor
+    is given the insert joins the caller's transaction; otherwise it runs in
+    its own transaction.
+    """
+    if not rows:
+        return
+    
+    sql = """
+        INSERT OR IGNORE INTO whatsapp_processed_messages 
+        (message_id, group_name, sender, processed_date) 
+        VALUES (?, ?, ?, ?)
+        """
+    
+    if cursor is not None:
+        cursor.executemany(sql, rows)
+        return
+    
+    with _db() as conn:
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+    
+    if _processed_ids is not None:
+        _processed_ids.update(row[0] for row in rows)
+
+def mark_message_processed(message_id, group_name, sender):
+    """Record a single processed message."""
+    mark_messages_processed([(message_id, group_name, sender, datetime.datetime.now().isoformat())])
+
+def bulk_insert_tasks(rows):
+    """Insert task rows in a single transaction, skipping processed messages.
+    
+    Each row is (problem_id, group_name, sender, message, task_description,
+    timestamp, status, priority, message_id). Returns the number of tasks added.
+    """
+    if not rows:
+        return 0
+    
+    processed_date = datetime.datetime.now().isoformat()
+    known = _processed_ids if _processed_ids is not None else ()
+    new_rows = []
+    
+    with _db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
         
-        if cursor.fetchone():
-            # Skip already processed messages
-            continue
-        
-        # Add to whatsapp_tasks table
-        cursor.execute(
-            """
-            INSERT INTO whatsapp_tasks 
-            (group_name, sender, message, task_description, timestamp, message_id) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                group_name,
-                task['sender'],
-                task['original_message'],
-                task['task_description'],
-                task['timestamp'],
-                task['message_id']
+        for row in rows:
+            # Messages in the in-memory set are known duplicates
+            if row[8] in known:
+                continue
+            
+            # Mark as processed; the primary key makes this a no-op for
+            # messages that were already seen, so rowcount doubles as the check
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO whatsapp_processed_messages 
+                (message_id, group_name, sender, processed_date) 
+                VALUES (?, ?, ?, ?)
+                """,
+                (row[8], row[1], row[2], processed_date)
             )
-        )
+            if cursor.rowcount == 1:
+                new_rows.append(row)
         
-        # Mark as processed
-        cursor.execute(
+        cursor.executemany(
             """
-            INSERT INTO whatsapp_processed_messages 
-            (message_id, group_name, sender, processed_date) 
-            VALUES (?, ?, ?, ?)
+            INSERT OR IGNORE INTO whatsapp_tasks 
+            (problem_id, group_name, sender, message, task_description, timestamp, status, priority, message_id) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (
-                task['message_id'],
-                group_name,
-                task['sender'],
-                datetime.datetime.now().isoformat()
-            )
+            new_rows
         )
-        
-        new_tasks_count += 1
+        tasks_added = max(cursor.rowcount, 0) if new_rows else 0
     
-    conn.commit()
-    conn.close()
+    if _processed_ids is not None:
+        _processed_ids.update(row[8] for row in new_rows)
     
-    return new_tasks_count
+    return tasks_added
 
 def assign_recent_tasks_to_problem(problem_id, count=10):
     """Assign recent WhatsApp tasks to a specific problem."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Check if problem exists
-    cursor.execute("SELECT title FROM problems WHERE id = ?", (problem_id,))
-    problem = cursor.fetchone()
-    
-    if not problem:
-        console.print(f"[red]Problem with ID {problem_id} not found.[/red]")
-        conn.close()
-        return False
-    
-    # Get recent unassigned tasks
-    cursor.execute(
-        """
-        SELECT id FROM whatsapp_tasks 
-        WHERE problem_id IS NULL AND status = 'pending' 
-        ORDER BY id DESC LIMIT ?
-        """,
-        (count,)
-    )
-    
-    task_ids = [row[0] for row in cursor.fetchall()]
-    
-    if not task_ids:
-        console.print("[yellow]No unassigned tasks found to assign to the problem.[/yellow]")
-        conn.close()
-        return False
-    
-    # Assign tasks to problem
-    for task_id in task_ids:
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        # Check if problem exists
+        cursor.execute("SELECT title FROM problems WHERE id = ?", (problem_id,))
+        problem = cursor.fetchone()
+        
+        if not problem:
+            console.print(f"[red]Problem with ID {problem_id} not found.[/red]")
+            return False
+        
+        # Get recent unassigned tasks
         cursor.execute(
-            "UPDATE whatsapp_tasks SET problem_id = ? WHERE id = ?",
-            (problem_id, task_id)
+            """
+            SELECT id FROM whatsapp_tasks 
+            WHERE problem_id IS NULL AND status = 'pending' 
+            ORDER BY id DESC LIMIT ?
+            """,
+            (count,)
         )
-    
-    conn.commit()
-    conn.close()
+        
+        task_ids = [row[0] for row in cursor.fetchall()]
+        
+        if not task_ids:
+            console.print("[yellow]No unassigned tasks found to assign to the problem.[/yellow]")
+            return False
+        
+        # Assign tasks to problem
+        for task_id in task_ids:
+            cursor.execute(
+                "UPDATE whatsapp_tasks SET problem_id = ? WHERE id = ?",
+                (problem_id, task_id)
+            )
+        
+        conn.commit()
     
     console.print(f"[green]Assigned {len(task_ids)} tasks to problem {problem_id}.[/green]")
     return True
 
 def configure_whatsapp():
     """Configure WhatsApp integration settings."""
-    global SELENIUM_AVAILABLE
     config = load_whatsapp_config()
     
     # Check if Selenium is available
     if not SELENIUM_AVAILABLE:
-        console.print("[yellow]Browser automation libraries not found. Installing required packages...[/yellow]")
-        try:
-            import pip
-            pip.main(['install', 'selenium', 'webdriver-manager'])
-            console.print("[green]Installed browser automation libraries successfully![/green]")
-            
-            # Try importing again after installation
-            try:
-                from selenium import webdriver
-                from selenium.webdriver.chrome.service import Service
-                from selenium.webdriver.chrome.options import Options
-                from selenium.webdriver.common.by import By
-                from selenium.webdriver.support.ui import WebDriverWait
-                from selenium.webdriver.support import expected_conditions as EC
-                from selenium.common.exceptions import TimeoutException, NoSuchElementException
-                from webdriver_manager.chrome import ChromeDriverManager
-                SELENIUM_AVAILABLE = True
-            except ImportError:
-                SELENIUM_AVAILABLE = False
-        except Exception as e:
-            console.print(f"[red]Failed to install required packages: {e}[/red]")
-            console.print("[yellow]You can manually install them with: pip install selenium webdriver-manager[/yellow]")
+        console.print("[yellow]Browser automation libraries not found.[/yellow]")
+        console.print("[yellow]Install them with: pip install 'empathic-solver[whatsapp]' (selenium, webdriver-manager)[/yellow]")
+        
+        # Allow continuing with export-based approach
+        if typer.confirm("Would you like to use chat export files instead of browser automation?", default=True):
+            config["use_export"] = True
+            export_path = typer.prompt("Path to download folder for WhatsApp exports", default=str(Path.home() / "Downloads"))
+            config["export_path"] = export_path
+            save_whatsapp_config(config)
+            console.print(f"[green]Set to use WhatsApp export files from: {export_path}[/green]")
+            console.print(Panel("""
+            [bold]WhatsApp Export Instructions:[/bold]
             
-            # Allow continuing with export-based approach
-            if typer.confirm("Would you like to use chat export files instead of browser automation?", default=True):
-                config["use_export"] = True
-                export_path = typer.prompt("Path to download folder for WhatsApp exports", default=str(Path.home() / "Downloads"))
-                config["export_path"] = export_path
-                save_whatsapp_config(config)
-                console.print(f"[green]Set to use WhatsApp export files from: {export_path}[/green]")
-                console.print(Panel("""
-                [bold]WhatsApp Export Instructions:[/bold]
-                
-                1. In WhatsApp Web, open a chat you want to monitor
-                2. Click the three dots (menu) at the top right
-                3. Select "More" > "Export chat"
-                4. Choose "Without media" 
-                5. Save the file to your configured downloads folder
-                6. Run 'scan-whatsapp --use-export' to process the exported files
-                """, title="Export Instructions"))
-                return config
+            1. In WhatsApp Web, open a chat you want to monitor
+            2. Click the three dots (menu) at the top right
+            3. Select "More" > "Export chat"
+            4. Choose "Without media" 
+            5. Save the file to your configured downloads folder
+            6. Run 'scan-whatsapp --use-export' to process the exported files
+            """, title="Export Instructions"))
+            return config
     
     # Enable/disable WhatsApp Web integration
     web_enabled = typer.confirm(
@@ -1482,35 +2628,41 @@ def command_scan_whatsapp(problem_id=None):
     else:
         console.print("[yellow]Scan completed, but no new tasks were found or there were errors.[/yellow]")
 
+# Rich colors for task status and priority; anything else falls back to the .get default
+_STATUS_STYLES = {"completed": "green", "pending": "yellow"}
+_PRIORITY_STYLES = {"high": "red", "medium": "yellow"}
+
 def command_list_whatsapp_tasks(problem_id=None, status=None, limit=20):
     """CLI command to list WhatsApp tasks."""
     console.print("[cyan]Listing WhatsApp tasks...[/cyan]")
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    query = "SELECT id, problem_id, group_name, sender, task_description, status, priority FROM whatsapp_tasks"
-    params = []
-    
-    where_clauses = []
-    if problem_id is not None:
-        where_clauses.append("problem_id = ?")
-        params.append(problem_id)
-    
-    if status is not None:
-        where_clauses.append("status = ?")
-        params.append(status)
-    
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
-    
-    query += " ORDER BY id DESC LIMIT ?"
-    params.append(limit)
-    
-    cursor.execute(query, params)
-    tasks = cursor.fetchall()
-    
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        # Problem titles come from the same query instead of a lookup per row
+        query = """
+        SELECT id, problem_id, problem_title, group_name, sender, task_description, status, priority
+        FROM v_whatsapp_task_full
+        """
+        params = []
+        
+        where_clauses = []
+        if problem_id is not None:
+            where_clauses.append("problem_id = ?")
+            params.append(problem_id)
+        
+        if status is not None:
+            where_clauses.append("status = ?")
+            params.append(status)
+        
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        tasks = cursor.fetchall()
     
     if not tasks:
         console.print("[yellow]No WhatsApp tasks found matching the criteria.[/yellow]")
@@ -1525,12 +2677,18 @@ def command_list_whatsapp_tasks(problem_id=None, status=None, limit=20):
     table.add_column("Status")
     table.add_column("Priority")
     
-    for task_id, prob_id, group, sender, desc, status, priority in tasks:
-        prob_display = str(prob_id) if prob_id else "Not assigned"
-        status_style = "green" if status == "completed" else "yellow" if status == "pending" else "blue"
-        priority_style = "red" if priority == "high" else "yellow" if priority == "medium" else "green"
+    add_row = table.add_row
+    for task_id, prob_id, prob_title, group, sender, desc, status, priority in tasks:
+        if not prob_id:
+            prob_display = "Not assigned"
+        elif prob_title:
+            prob_display = f"{prob_id}: {prob_title[:20]}"
+        else:
+            prob_display = str(prob_id)
+        status_style = _STATUS_STYLES.get(status, "blue")
+        priority_style = _PRIORITY_STYLES.get(priority, "green")
         
-        table.add_row(
+        add_row(
             str(task_id),
             prob_display,
             group,
@@ -1542,125 +2700,135 @@ def command_list_whatsapp_tasks(problem_id=None, status=None, limit=20):
     
     console.print(table)
 
+def _write_task(cursor, sql, params, task_id, columns="task_description"):
+    """Run an UPDATE/DELETE on one task and return its columns, or None if no row matched.
+    
+    Uses RETURNING where SQLite supports it; older builds read the row first
+    and check rowcount, which is equivalent under the shared connection's lock.
+    """
+    if SQLITE_HAS_RETURNING:
+        cursor.execute(f"{sql} RETURNING {columns}", params)
+        return cursor.fetchone()
+    
+    cursor.execute(f"SELECT {columns} FROM whatsapp_tasks WHERE id = ?", (task_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    
+    cursor.execute(sql, params)
+    return row if cursor.rowcount else None
+
 def command_complete_whatsapp_task(task_id):
     """CLI command to mark a WhatsApp task as completed."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    
-    if not task:
-        console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
-        return
-    
-    cursor.execute("UPDATE whatsapp_tasks SET status = 'completed' WHERE id = ?", (task_id,))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        task = _write_task(
+            cursor,
+            "UPDATE whatsapp_tasks SET status = 'completed' WHERE id = ?",
+            (task_id,),
+            task_id
+        )
+        
+        if not task:
+            console.print(f"[red]Task with ID {task_id} not found.[/red]")
+            return
+        
+        conn.commit()
     
     console.print(f"[green]Task {task_id} marked as completed.[/green]")
 
 def command_pending_whatsapp_task(task_id):
     """CLI command to mark a WhatsApp task as pending."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    
-    if not task:
-        console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
-        return
-    
-    cursor.execute("UPDATE whatsapp_tasks SET status = 'pending' WHERE id = ?", (task_id,))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        task = _write_task(
+            cursor,
+            "UPDATE whatsapp_tasks SET status = 'pending' WHERE id = ?",
+            (task_id,),
+            task_id
+        )
+        
+        if not task:
+            console.print(f"[red]Task with ID {task_id} not found.[/red]")
+            return
+        
+        conn.commit()
     
     console.print(f"[green]Task {task_id} marked as pending.[/green]")
 
 def command_assign_whatsapp_task(task_id, problem_id):
     """CLI command to assign a WhatsApp task to a problem."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Check if task exists
-    cursor.execute("SELECT task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    
-    if not task:
-        console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
-        return
-    
-    # Check if problem exists
-    cursor.execute("SELECT title FROM problems WHERE id = ?", (problem_id,))
-    problem = cursor.fetchone()
-    
-    if not problem:
-        console.print(f"[red]Problem with ID {problem_id} not found.[/red]")
-        conn.close()
-        return
-    
-    cursor.execute("UPDATE whatsapp_tasks SET problem_id = ? WHERE id = ?", (problem_id, task_id))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        # Update only if the problem exists; work out what was missing only on failure
+        cursor.execute(
+            "UPDATE whatsapp_tasks SET problem_id = ? WHERE id = ? "
+            "AND EXISTS (SELECT 1 FROM problems WHERE id = ?)",
+            (problem_id, task_id, problem_id)
+        )
+        
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT 1 FROM whatsapp_tasks WHERE id = ?", (task_id,))
+            if cursor.fetchone() is None:
+                console.print(f"[red]Task with ID {task_id} not found.[/red]")
+            else:
+                console.print(f"[red]Problem with ID {problem_id} not found.[/red]")
+            return
+        
+        conn.commit()
     
     console.print(f"[green]Task {task_id} assigned to problem {problem_id}.[/green]")
 
 def command_convert_whatsapp_task(task_id):
     """CLI command to convert a WhatsApp task to an action step."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT problem_id, task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    
-    if not task:
-        console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
-        return
-    
-    problem_id, description = task
-    
-    if not problem_id:
-        console.print(f"[yellow]Task {task_id} is not assigned to any problem. Assign it first.[/yellow]")
-        conn.close()
-        return
-    
-    # Add as action step
-    cursor.execute(
-        "INSERT INTO action_steps (problem_id, description) VALUES (?, ?)",
-        (problem_id, description)
-    )
-    
-    # Mark the WhatsApp task as converted
-    cursor.execute(
-        "UPDATE whatsapp_tasks SET status = 'converted' WHERE id = ?",
-        (task_id,)
-    )
-    
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        # Mark the WhatsApp task as converted, getting back what the action step needs
+        task = _write_task(
+            cursor,
+            "UPDATE whatsapp_tasks SET status = 'converted' WHERE id = ? AND problem_id IS NOT NULL",
+            (task_id,),
+            task_id,
+            columns="problem_id, task_description"
+        )
+        
+        if not task:
+            cursor.execute("SELECT 1 FROM whatsapp_tasks WHERE id = ?", (task_id,))
+            if cursor.fetchone() is None:
+                console.print(f"[red]Task with ID {task_id} not found.[/red]")
+            else:
+                console.print(f"[yellow]Task {task_id} is not assigned to any problem. Assign it first.[/yellow]")
+            return
+        
+        problem_id, description = task
+        
+        # Add as action step
+        cursor.execute(
+            "INSERT INTO action_steps (problem_id, description) VALUES (?, ?)",
+            (problem_id, description)
+        )
+        
+        conn.commit()
     
     console.print(f"[green]Task {task_id} converted to action step for problem {problem_id}.[/green]")
 
 def command_view_whatsapp_task(task_id):
     """CLI command to view detailed information about a WhatsApp task."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-    SELECT wt.id, wt.problem_id, p.title, wt.group_name, wt.sender, wt.message, 
-           wt.task_description, wt.timestamp, wt.status, wt.priority
-    FROM whatsapp_tasks wt
-    LEFT JOIN problems p ON wt.problem_id = p.id
-    WHERE wt.id = ?
-    """, (task_id,))
-    
-    task = cursor.fetchone()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT id, problem_id, problem_title, group_name, sender, message, 
+               task_description, timestamp, status, priority
+        FROM v_whatsapp_task_full
+        WHERE id = ?
+        """, (task_id,))
+        
+        task = cursor.fetchone()
     
     if not task:
         console.print(f"[red]Task with ID {task_id} not found.[/red]")
@@ -1669,8 +2837,8 @@ def command_view_whatsapp_task(task_id):
     task_id, problem_id, problem_title, group, sender, message, desc, timestamp, status, priority = task
     
     problem_display = f"{problem_id}: {problem_title}" if problem_id else "Not assigned"
-    status_style = "green" if status == "completed" else "yellow" if status == "pending" else "blue"
-    priority_style = "red" if priority == "high" else "yellow" if priority == "medium" else "green"
+    status_style = _STATUS_STYLES.get(status, "blue")
+    priority_style = _PRIORITY_STYLES.get(priority, "green")
     
     console.print(Panel(
         f"[bold]Task ID:[/bold] {task_id}\n"
@@ -1688,23 +2856,29 @@ def command_view_whatsapp_task(task_id):
 
 def command_delete_whatsapp_task(task_id):
     """CLI command to delete a WhatsApp task."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
+    with _db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM whatsapp_tasks WHERE id = ?", (task_id,))
+        task = cursor.fetchone()
     
     if not task:
         console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
         return
     
-    if typer.confirm(f"Are you sure you want to delete task {task_id}?"):
-        cursor.execute("DELETE FROM whatsapp_tasks WHERE id = ?", (task_id,))
-        conn.commit()
-        console.print(f"[green]Task {task_id} deleted.[/green]")
+    # Ask outside the lock so the background scanner isn't blocked on the user
+    if not typer.confirm(f"Are you sure you want to delete task {task_id}?"):
+        return
+    
+    with _db() as conn:
+        cursor = conn.cursor()
+        task = _write_task(cursor, "DELETE FROM whatsapp_tasks WHERE id = ?", (task_id,), task_id)
+    
+    # The task may have been deleted elsewhere while we were waiting
+    if not task:
+        console.print(f"[red]Task with ID {task_id} not found.[/red]")
+        return
     
-    conn.close()
+    console.print(f"[green]Task {task_id} deleted.[/green]")
 
 def command_update_whatsapp_task_priority(task_id, priority):
     """CLI command to update the priority of a WhatsApp task."""
@@ -1713,25 +2887,30 @@ def command_update_whatsapp_task_priority(task_id, priority):
         console.print(f"[red]Invalid priority. Use one of: {', '.join(valid_priorities)}[/red]")
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT task_description FROM whatsapp_tasks WHERE id = ?", (task_id,))
-    task = cursor.fetchone()
-    
-    if not task:
-        console.print(f"[red]Task with ID {task_id} not found.[/red]")
-        conn.close()
-        return
-    
-    cursor.execute("UPDATE whatsapp_tasks SET priority = ? WHERE id = ?", (priority.lower(), task_id))
-    conn.commit()
-    conn.close()
+    with _db() as conn:
+        cursor = conn.cursor()
+        
+        task = _write_task(
+            cursor,
+            "UPDATE whatsapp_tasks SET priority = ? WHERE id = ?",
+            (priority.lower(), task_id),
+            task_id
+        )
+        
+        if not task:
+            console.print(f"[red]Task with ID {task_id} not found.[/red]")
+            return
+        
+        conn.commit()
     
     console.print(f"[green]Task {task_id} priority updated to {priority}.[/green]")
 
 # Initialize background scanner if auto-scan is enabled
 background_scanner_thread = None
+_scanner_stop = threading.Event()
+_scanner_wake = threading.Event()
+SCANNER_CONFIG_POLL = 60  # seconds between checks for config changes made by other processes
+_SCANNER_SETTINGS = ("auto_scan", "whatsapp_web_enabled", "scan_interval")
 
 def init_background_scanner():
     """Initialize the background scanner if enabled in config."""
@@ -1741,6 +2920,27 @@ def init_background_scanner():
     if config.get("auto_scan", False) and config.get("whatsapp_web_enabled", False):
         background_scanner_thread = start_background_scanner()
 
+def _wait_for_next_scan(started):
+    """Wait until the next scan is due.
+    
+    Wakes early when the scanner is stopped or its settings change, so a new
+    interval or a disabled auto-scan takes effect without waiting out the old
+    interval. Returns False if the scanner should stop.
+    """
+    while True:
+        config = load_whatsapp_config()
+        if not config.get("auto_scan", False) or not config.get("whatsapp_web_enabled", False):
+            return False
+        
+        remaining = started + config.get("scan_interval", 3600) - time.monotonic()
+        if remaining <= 0:
+            return True
+        
+        _scanner_wake.wait(min(remaining, SCANNER_CONFIG_POLL))
+        _scanner_wake.clear()
+        if _scanner_stop.is_set():
+            return False
+
 def start_background_scanner():
     """Start the background scanner thread if enabled."""
     config = load_whatsapp_config()
@@ -1748,8 +2948,12 @@ def start_background_scanner():
     if not config.get("auto_scan", False) or not config.get("whatsapp_web_enabled", False):
         return None
     
+    prune_claude_cache()
+    _scanner_stop.clear()
+    
     def scanner_thread():
-        while True:
+        while not _scanner_stop.is_set():
+            started = time.monotonic()
             try:
                 # Reload config each time to get latest settings
                 current_config = load_whatsapp_config()
@@ -1763,15 +2967,17 @@ def start_background_scanner():
                     break
                 
                 # Run the scan
-                scan_interval = current_config.get("scan_interval", 3600)
                 console.print(f"[cyan]Auto-scan: Running WhatsApp scan...[/cyan]")
                 scan_whatsapp_messages()
                 
-                # Sleep for the configured interval
-                time.sleep(scan_interval)
+                # Wait for the configured interval
+                if not _wait_for_next_scan(started):
+                    break
             except Exception as e:
                 console.print(f"[red]Error in background scanner: {e}[/red]")
-                time.sleep(300)  # Wait 5 minutes before retrying after error
+                # Wait 5 minutes before retrying after error
+                if _scanner_stop.wait(300):
+                    break
     
     thread = threading.Thread(target=scanner_thread, daemon=True)
     thread.start()
@@ -1779,6 +2985,14 @@ def start_background_scanner():
     console.print("[green]Started WhatsApp background scanner thread.[/green]")
     return thread
 
+def stop_background_scanner(timeout=None):
+    """Stop the background scanner once its current scan (if any) finishes."""
+    _scanner_stop.set()
+    _scanner_wake.set()
+    
+    if background_scanner_thread is not None:
+        background_scanner_thread.join(timeout)
+
 # When run directly, initialize the module
 if __name__ == "__main__":
     init_whatsapp_integration()